@@ -0,0 +1,133 @@
+import logging
+import threading
+import time
+
+from pyvisa.errors import VisaIOError
+
+logger = logging.getLogger(__name__)
+
+
+class AnalyzerSession:
+    # keeps the analyzer initialized between runs, settings are tracked and only the changed ones are sent;
+    # a dropped VISA session is re-opened once per failed acquisition
+
+    # state init_instrument() leaves the analyzer in
+    defaults = {'harmonic': 1, 'binary': False, 'points': None}
+
+    def __init__(self, instruments, persistent=True):
+        self._instruments = instruments
+        self.persistent = persistent
+
+        self._lock = threading.RLock()
+        self._open = False
+        self._wanted = dict(self.defaults)
+        self._applied = dict()
+
+        self.setup_time = 0.0
+        self.acquire_time = 0.0
+        self.opens = 0
+        self.reconnects = 0
+
+    def _apply_harmonic(self, value):
+        self._instruments.harmonic = value
+
+    def _apply_binary(self, value):
+        if value:
+            self._instruments.setup_transfer()
+        else:
+            self._instruments.reset_transfer()
+
+    def _apply_points(self, value):
+        inst = getattr(self._instruments._analyzer, '_inst', None)
+        if value and inst is not None:
+            inst.write(f'SENS1:SWE:POIN {value}')
+
+    def _sync(self):
+        start = time.perf_counter()
+        for key, value in self._wanted.items():
+            if self._applied.get(key) == value:
+                continue
+            getattr(self, f'_apply_{key}')(value)
+            self._applied[key] = value
+        self.setup_time += time.perf_counter() - start
+
+    def configure(self, **settings):
+        with self._lock:
+            self._wanted.update(settings)
+            if self._open:
+                self._sync()
+
+    def open(self):
+        with self._lock:
+            if self._open:
+                self._sync()
+                return
+            logger.info('open analyzer session')
+            start = time.perf_counter()
+            self._instruments._analyzer.init_instrument()
+            self.setup_time += time.perf_counter() - start
+            self._applied = dict(self.defaults)
+            self._open = True
+            self.opens += 1
+            self._sync()
+
+    def close(self):
+        with self._lock:
+            if not self._open:
+                return
+            logger.info('close analyzer session')
+            try:
+                self._apply_binary(False)
+                self._instruments._analyzer.finish()
+            except Exception as ex:
+                logger.warning('analyzer session close error: %s', ex)
+            self._open = False
+            self._applied = dict()
+
+    def reconnect(self):
+        with self._lock:
+            logger.info('reconnect analyzer session')
+            # the dropped session is released before a new one is opened on the same address
+            try:
+                self._instruments._analyzer.finish()
+            except (VisaIOError, OSError) as ex:
+                logger.warning('analyzer session close error: %s', ex)
+            self._open = False
+            self._applied = dict()
+            self._instruments._find_analyzer()
+            self.reconnects += 1
+            self.open()
+
+    def acquire(self, code):
+        with self._lock:
+            self.open()
+            start = time.perf_counter()
+            try:
+                return self._instruments.acquire(code)
+            except (VisaIOError, OSError) as ex:
+                # mocks have no VISA session to lose
+                if getattr(self._instruments._analyzer, '_inst', None) is None:
+                    raise
+                logger.warning('analyzer session lost: %s', ex)
+                self.reconnect()
+                start = time.perf_counter()
+                return self._instruments.acquire(code)
+            finally:
+                self.acquire_time += time.perf_counter() - start
+
+    def reset_stats(self):
+        self.setup_time = 0.0
+        self.acquire_time = 0.0
+
+    @property
+    def stats(self):
+        return {
+            'setup': self.setup_time,
+            'acquire': self.acquire_time,
+            'opens': self.opens,
+            'reconnects': self.reconnects,
+        }
+
+    @property
+    def is_open(self):
+        return self._open
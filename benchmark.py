@@ -0,0 +1,272 @@
+import argparse
+import gc
+import os
+import sys
+import tempfile
+import time
+import timeit
+import tracemalloc
+
+import numpy as np
+
+from PyQt5.QtCore import QCoreApplication
+
+from cutoffstats import cutoff_stats
+from domain import Domain, InstrumentManager
+from tracematrix import SharedAxis, TraceMatrix, storage_modes
+from excelexport import snapshot as excel_snapshot, write_workbook
+from imageexport import snapshot as image_snapshot, render, renderers
+
+
+def synthetic_sweep(codes=128, points=1601):
+    freqs = np.logspace(6, 9, points)
+    cutoffs = np.geomspace(1e7, 5e8, codes)
+    amps = -10 * np.log10(1 + (freqs / cutoffs[:, None]) ** 8)
+    return np.broadcast_to(freqs, amps.shape), amps
+
+
+def legacy_stats(freqs, amps, cutoff):
+    # list based _processStats as it was before the batched version, kept as a reference
+    max_amp = max(map(max, amps))
+    cutoff_mag = max_amp + cutoff
+
+    cutoff_freqs, loss_double, loss_triple = list(), list(), list()
+    for a, f in zip(amps, freqs):
+        cutoff_freq = f[a.index(min(a, key=lambda x: abs(cutoff_mag - x)))]
+        cutoff_freqs.append(cutoff_freq)
+
+        amp_max = max(a)
+
+        double_f = cutoff_freq * 2
+        triple_f = cutoff_freq * 3
+        double_f_index = f.index(min(f, key=lambda x: abs(double_f - x)))
+        triple_f_index = f.index(min(f, key=lambda x: abs(triple_f - x)))
+
+        loss_double.append(amp_max - a[double_f_index])
+        loss_triple.append(amp_max - a[triple_f_index])
+
+    return cutoff_freqs, loss_double, loss_triple
+
+
+def bench_stats(codes=128, points=1601, cutoff=-6, repeat=3):
+    freqs, amps = synthetic_sweep(codes, points)
+    freq_lists, amp_lists = freqs.tolist(), amps.tolist()
+
+    legacy = min(timeit.repeat(lambda: legacy_stats(freq_lists, amp_lists, cutoff), number=1, repeat=repeat))
+    batched = min(timeit.repeat(lambda: cutoff_stats(freqs, amps, cutoff), number=1, repeat=repeat))
+
+    ref = np.array(legacy_stats(freq_lists, amp_lists, cutoff)[0])
+    new = cutoff_stats(freqs, amps, cutoff).cutoff_freqs
+    step = np.diff(freqs[0]).max()
+
+    print(f'stats {codes} codes x {points} points, cutoff {cutoff} dB')
+    print(f'  legacy:  {legacy * 1000:10.2f} ms')
+    print(f'  batched: {batched * 1000:10.2f} ms  (x{legacy / batched:.0f})')
+    print(f'  max cutoff difference: {np.abs(ref - new).max():.3e} Hz, frequency step {step:.3e} Hz')
+
+
+class SyntheticAnalyzer:
+    # Obzor304Mock stand-in with a configurable trace size and sweep time,
+    # answers with the same comma separated re,im strings as the real analyzer
+
+    def __init__(self, points=1601, latency=0.0):
+        self.points = points
+        self.latency = latency
+        self._freqs = np.logspace(6, 9, points)
+        self._freq_str = ','.join(map(repr, self._freqs.tolist()))
+
+    def init_instrument(self):
+        pass
+
+    def finish(self):
+        pass
+
+    def measure(self, code):
+        time.sleep(self.latency)
+        cutoff = np.geomspace(1e7, 5e8, 128)[code % 128]
+        amps = np.zeros(2 * self.points)
+        amps[::2] = -10 * np.log10(1 + (self._freqs / cutoff) ** 8)
+        return self._freq_str, ','.join(map(repr, amps.tolist()))
+
+    def __str__(self):
+        return f'synthetic analyzer, {self.points} points'
+
+
+class SyntheticProgrammer:
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+
+    def set_lpf_code(self, code, address):
+        time.sleep(self.latency)
+        return True
+
+    def __str__(self):
+        return 'synthetic programmer'
+
+
+def bench_domain(codes, points, sweep_latency=0.0, program_latency=0.0, binary=False, stream=False):
+    # not a mock manager: mock managers cap the sweep at a few codes
+    instruments = InstrumentManager(cache_path=os.devnull, mock=False)
+    instruments._analyzer = SyntheticAnalyzer(points, sweep_latency)
+    instruments._programmer = SyntheticProgrammer(program_latency)
+    instruments.binary_transfer = binary
+    instruments.stream_transfer = stream
+
+    # the code range is a class constant, the benchmark domain gets its own
+    domain = type('BenchDomain', (Domain, ), {'MAXREG': codes - 1})(instruments=instruments)
+    domain.store = None
+    domain.timingLog = None
+    return domain
+
+
+def _measure(domain):
+    domain._clear()
+    domain._resetControl()
+    domain._measureTask()
+
+
+def _harmonics(domain):
+    domain.harms.clear()
+    domain.harm_deltas.clear()
+    domain._resetControl()
+    domain._measureHarmonicTask()
+
+
+def _excel(domain, path):
+    write_workbook(os.path.join(path, 'bench.xlsx'), excel_snapshot(domain))
+
+
+def _png(domain, path):
+    data = image_snapshot(domain)
+    for name in renderers:
+        render(name, data, path, dpi=100)
+
+
+# benchmarked steps in run order, every step works on the state the previous ones left
+steps = {
+    'measure': _measure,
+    'stats': lambda domain: domain._processStats(),
+    'harmonics': _harmonics,
+    'excel': _excel,
+    'png': _png,
+}
+
+
+def _run_step(name, domain, path, memory):
+    fn = steps[name]
+    args = (domain, path) if name in ('excel', 'png') else (domain, )
+    if memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    fn(*args)
+    elapsed = time.perf_counter() - start
+    peak = 0
+    if memory:
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return elapsed, peak, domain.stageTimes if name in ('measure', 'harmonics') else dict()
+
+
+def bench_pipeline(codes=128, points=1601, sweep_latency=0.0, program_latency=0.0, binary=False, stream=False,
+                   selected=tuple(steps), memory=True):
+    # timings come from a clean pass, tracemalloc slows python code down and gets a pass of its own
+    results = dict()
+    with tempfile.TemporaryDirectory() as path:
+        for traced in (False, True) if memory else (False, ):
+            domain = bench_domain(codes, points, sweep_latency, program_latency, binary, stream)
+            for name in steps:
+                if name not in selected and name not in ('measure', 'stats'):
+                    continue
+                elapsed, peak, stages = _run_step(name, domain, path, traced)
+                if traced:
+                    results[name]['peak'] = peak
+                else:
+                    results[name] = {'time': elapsed, 'peak': 0, 'stages': stages}
+
+    print(f'pipeline {codes} codes x {points} points, sweep latency {sweep_latency * 1000:.0f} ms, '
+          f'program latency {program_latency * 1000:.0f} ms, {"binary" if binary else "ASCII"} '
+          f'{"streamed " if stream else ""}transfer')
+    for name, result in results.items():
+        if name not in selected:
+            continue
+        print(f'  {name:>9}: {result["time"] * 1000:10.1f} ms {codes / result["time"]:10.1f} codes/s'
+              f'  peak {result["peak"] / 2 ** 20:8.1f} MiB')
+        for stage, elapsed in result['stages'].items():
+            if elapsed:
+                print(f'  {"":>9}  {stage:>8}: {elapsed * 1000:10.1f} ms')
+    return results
+
+
+def _traced(build):
+    gc.collect()
+    tracemalloc.start()
+    kept = build()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del kept
+    return size
+
+
+def bench_memory(codes=128, points=1601, harmonics=2):
+    # one sweep with its harmonic traces: lists of python floats as the domain used to keep them,
+    # against the trace containers in every storage mode
+    freqs, amps = synthetic_sweep(codes, points)
+    samples = codes * points * (2 + harmonics)
+
+    def lists():
+        return [row.tolist() for row in freqs], [[row.tolist() for row in amps] for _ in range(1 + harmonics)]
+
+    def containers(mode):
+        def build():
+            axis = SharedAxis(codes)
+            traces = [TraceMatrix(codes, mode) for _ in range(1 + harmonics)]
+            freq_str = ','.join(map(repr, freqs[0].tolist()))
+            for code in range(codes):
+                axis.put(code, freq_str, lambda raw: np.fromstring(raw, sep=','))
+                for matrix in traces:
+                    matrix.put(code, amps[code])
+            return axis, traces
+        return build
+
+    print(f'trace memory {codes} codes x {points} points, {harmonics} harmonics')
+    reference = _traced(lists)
+    print(f'  {"lists":>8}: {reference / 2 ** 20:8.1f} MiB {reference / samples:6.1f} B/sample')
+    for mode in storage_modes:
+        size = _traced(containers(mode))
+        error = np.abs(TraceMatrix(1, mode).put(0, amps[-1]) - amps[-1]).max()
+        print(f'  {mode:>8}: {size / 2 ** 20:8.1f} MiB {size / samples:6.1f} B/sample  (x{reference / size:.0f} smaller, '
+              f'max error {error:.1e} dB)')
+
+
+def parse_args(args):
+    parser = argparse.ArgumentParser(description='LPF measurement processing benchmarks on synthetic instruments.')
+    parser.add_argument('--points', type=int, nargs='+', default=[201, 1601, 16001],
+                        help='analyzer points per trace, one run per value (default: 201 1601 16001)')
+    parser.add_argument('--codes', type=int, default=128, help='codes per sweep (default: 128)')
+    parser.add_argument('--sweep-latency', type=float, default=0.0, help='analyzer sweep time, ms')
+    parser.add_argument('--program-latency', type=float, default=0.0, help='programmer write time, ms')
+    parser.add_argument('--binary', action='store_true', help='REAL64 block transfer instead of ASCII')
+    parser.add_argument('--stream', action='store_true', help='parse traces chunk by chunk while they are read')
+    parser.add_argument('--steps', nargs='+', choices=list(steps), default=list(steps), help='steps to report')
+    parser.add_argument('--no-memory', action='store_true', help='skip the tracemalloc pass')
+    parser.add_argument('--memory-report', action='store_true', help='compare trace storage layouts')
+    parser.add_argument('--legacy', action='store_true', help='also compare the batched stats with the legacy code')
+    return parser.parse_args(args)
+
+
+def main(args):
+    args = parse_args(args[1:])
+    app = QCoreApplication(sys.argv)
+
+    for points in args.points:
+        if args.legacy:
+            bench_stats(codes=args.codes, points=points)
+        if args.memory_report:
+            bench_memory(codes=args.codes, points=points)
+        bench_pipeline(args.codes, points, args.sweep_latency / 1000, args.program_latency / 1000, args.binary,
+                       args.stream, args.steps, not args.no_memory)
+
+
+if __name__ == '__main__':
+    main(sys.argv)
@@ -0,0 +1,69 @@
+from collections import namedtuple
+
+import numpy as np
+
+CutoffStats = namedtuple('CutoffStats', ['cutoff_amp', 'cutoff_freqs', 'loss_double', 'loss_triple'])
+
+
+def _shared_axis(freqs):
+    freqs = np.asarray(freqs)
+    if freqs.ndim == 1:
+        return freqs
+    if freqs.strides[0] == 0:
+        # broadcast view of a single axis
+        return freqs[0]
+    if len(freqs) and np.array_equal(freqs, np.broadcast_to(freqs[0], freqs.shape)):
+        return freqs[0]
+    return None
+
+
+def _interp_rows(axis, values, targets):
+    # per-row linear interpolation on a monotonic axis, O(log n) lookup for each row
+    rows = np.arange(len(values))
+    if axis.ndim == 1:
+        hi = np.searchsorted(axis, targets)
+    else:
+        hi = np.array([np.searchsorted(f, t) for f, t in zip(axis, targets)], dtype=int)
+    hi = np.clip(hi, 1, values.shape[1] - 1)
+    lo = hi - 1
+
+    f_lo = axis[lo] if axis.ndim == 1 else axis[rows, lo]
+    f_hi = axis[hi] if axis.ndim == 1 else axis[rows, hi]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        w = np.clip(np.nan_to_num((targets - f_lo) / (f_hi - f_lo)), 0, 1)
+    return values[rows, lo] * (1 - w) + values[rows, hi] * w
+
+
+def cutoff_stats(freqs, amps, cutoff_mag, max_amp=None):
+    amps = np.asarray(amps, dtype=np.float64)
+    axis = _shared_axis(freqs)
+    if axis is None:
+        axis = np.asarray(freqs, dtype=np.float64)
+
+    rows = np.arange(len(amps))
+    points = amps.shape[1]
+
+    # the cutoff level is relative to the sweep-wide maximum, pass it in when amps is a subset of the sweep
+    cutoff_amp = (amps.max() if max_amp is None else max_amp) + cutoff_mag
+    amp_max = amps.max(axis=1)
+
+    # first point past the passband peak that falls below the cutoff level
+    peak = amps.argmax(axis=1)
+    below = (amps < cutoff_amp) & (np.arange(points) >= peak[:, None])
+    found = below.any(axis=1)
+    hi = np.where(found, below.argmax(axis=1), points - 1)
+    hi = np.clip(hi, 1, points - 1)
+    lo = hi - 1
+
+    a_lo, a_hi = amps[rows, lo], amps[rows, hi]
+    f_lo = axis[lo] if axis.ndim == 1 else axis[rows, lo]
+    f_hi = axis[hi] if axis.ndim == 1 else axis[rows, hi]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        w = np.clip(np.nan_to_num((a_lo - cutoff_amp) / (a_lo - a_hi)), 0, 1)
+    w = np.where(found, w, 1)
+    cutoff_freqs = f_lo + (f_hi - f_lo) * w
+
+    loss_double = amp_max - _interp_rows(axis, amps, cutoff_freqs * 2)
+    loss_triple = amp_max - _interp_rows(axis, amps, cutoff_freqs * 3)
+
+    return CutoffStats(cutoff_amp, cutoff_freqs, loss_double, loss_triple)
@@ -1,7 +1,14 @@
+import json
+import logging
+import queue
+import threading
 import time
+import numpy as np
 import serial
 
-from collections import defaultdict
+from collections import defaultdict, namedtuple
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FuturesTimeout
+from serial.tools import list_ports
 from PyQt5.QtCore import QObject, pyqtSignal, QRunnable, pyqtSlot, QThreadPool
 
 from arduino.arduinospi import ArduinoSpi
@@ -11,116 +18,199 @@ from arduino.arduinoparallel import ArduinoParallel
 from instr.obzor304 import Obzor304
 from instr.obzor304mock import Obzor304Mock
 
+from analyzersession import AnalyzerSession
+from cutoffstats import cutoff_stats
+from ieeeblock import encode_block, parse_block, query_block
+from stagetimer import StageTimer, format_summary
+from sweepstore import SweepStore
+from tracecache import TraceCache
+from tracematrix import SharedAxis, TraceMatrix, storage_modes
+from tracestream import TraceStream, bytes_chunks, read_ascii_chunks, read_block_chunks, text_chunks
+
+logger = logging.getLogger(__name__)
+
 # MOCK
 def_mock = True
 
+instrument_cache_path = 'instruments.json'
+find_timeout = 5.0
+find_workers = 8
+timing_log_path = 'timing.jsonl'
+
+# per-code results of a sweep, replaced as a whole
+StatsSnapshot = namedtuple('StatsSnapshot', ['codes', 'cutoff_freqs', 'interpolated', 'loss_double_freq',
+                                             'loss_triple_freq', 'cutoff_freq_delta_x', 'cutoff_freq_delta_y'])
+empty_stats = StatsSnapshot(np.empty(0, dtype=int), np.empty(0), np.empty(0, dtype=bool), np.empty(0), np.empty(0),
+                            np.empty(0, dtype=int), np.empty(0))
+
 
 class MeasureContext:
 
     def __init__(self, model):
-        self._model = model
+        self._session = model.session
 
     def __enter__(self):
-        print('\nacquire analyzer context\n')
-        self._model._analyzer.init_instrument()
+        self._session.open()
 
     def __exit__(self, *args):
-        print('\nexit analyzer context\n')
-        self._model._analyzer.finish()
+        # a persistent session stays open for the next run
+        if not self._session.persistent:
+            self._session.close()
 
 
 class InstrumentManager:
 
-    def __init__(self):
-        self._analyzer_addr = 'TCPIP::192.168.0.3::INSTR'
+    def __init__(self, cache_path=instrument_cache_path, mock=None):
+        self._mock = def_mock if mock is None else mock
+        self._cache_path = cache_path
+        self._cache = self._load_cache()
+
+        self._analyzer_addr = self._cache.get('analyzer', 'TCPIP::192.168.0.3::INSTR')
 
         self._programmer = None
         self._analyzer = None
+        self._programmer_port = '', ''
 
         self._available_ports = list()
+        self._excluded_ports = set()
 
         self._harmonic = 1
         self._spi_pin_address = 0
 
-    def _find_ports(self):
-        for port in [f'COM{i+1}' for i in range(256)]:
-            try:
-                s = serial.Serial(port=port, baudrate=115200)
-                s.close()
-                self._available_ports.append(port)
-            except (OSError, serial.SerialException):
-                pass
-
-    def _find_spi_port(self):
-        for port in self._available_ports:
-            s = serial.Serial(port=port, baudrate=115200, timeout=0.5)
-            if s.is_open:
-                s.write(b'<n>')
-                ans = s.read(9)
-                s.close()
-                if b'SPI' in ans:
-                    return port
-        else:
-            return ''
+        self._binary_transfer = False
+        self._stream_transfer = False
 
-    def _find_parallel_port(self):
-        for port in self._available_ports:
-            s = serial.Serial(port=port, baudrate=115200, stopbits=serial.STOPBITS_ONE, bytesize=8,
-                              parity=serial.PARITY_NONE, timeout=0.5)
-            if s.is_open:
-                s.write(b'#NAME')
-                time.sleep(0.3)
-                ans = s.read_all()
-                s.close()
-                if b'ARDUINO' in ans:
-                    return port
-        else:
-            return ''
+        self._session = AnalyzerSession(self)
+        self.timing = StageTimer()
 
-    def _find_programmer(self):
-        if def_mock:
+    def _load_cache(self):
+        try:
+            with open(self._cache_path, mode='rt', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return dict()
+
+    def _save_cache(self, port, kind):
+        self._cache = {'port': port, 'kind': kind, 'analyzer': self._analyzer_addr}
+        try:
+            with open(self._cache_path, mode='wt', encoding='utf-8') as f:
+                json.dump(self._cache, f, indent=2)
+        except OSError as ex:
+            logger.warning('error saving instrument cache: %s', ex)
+
+    def _find_ports(self):
+        self._available_ports = [p.device for p in list_ports.comports() if p.device not in self._excluded_ports]
+
+    def _probe_spi_port(self, port, deadline):
+        timeout = min(0.5, max(deadline - time.monotonic(), 0.05))
+        with serial.Serial(port=port, baudrate=115200, timeout=timeout) as s:
+            s.write(b'<n>')
+            return b'SPI' in s.read(9)
+
+    def _probe_parallel_port(self, port, deadline):
+        timeout = min(0.5, max(deadline - time.monotonic(), 0.05))
+        with serial.Serial(port=port, baudrate=115200, stopbits=serial.STOPBITS_ONE, bytesize=8,
+                           parity=serial.PARITY_NONE, timeout=timeout) as s:
+            s.write(b'#NAME')
+            time.sleep(min(0.3, timeout))
+            return b'ARDUINO' in s.read_all()
+
+    def _probe_port(self, port, deadline):
+        # both probes share one port handle
+        if time.monotonic() >= deadline:
+            return ''
+        try:
+            if self._probe_parallel_port(port, deadline):
+                return 'parallel'
+            if time.monotonic() < deadline and self._probe_spi_port(port, deadline):
+                return 'spi'
+        except (OSError, serial.SerialException):
+            pass
+        return ''
+
+    def _scan_ports(self, ports, deadline):
+        if not ports:
+            return '', ''
+
+        found_port, found_kind = '', ''
+        pool = ThreadPoolExecutor(max_workers=min(len(ports), find_workers))
+        futures = {pool.submit(self._probe_port, port, deadline): port for port in ports}
+        try:
+            for future in as_completed(futures, timeout=max(deadline - time.monotonic(), 0)):
+                kind = future.result()
+                if kind == 'parallel':
+                    return futures[future], kind
+                if kind == 'spi' and not found_port:
+                    found_port, found_kind = futures[future], kind
+        except FuturesTimeout:
+            logger.info('port scan deadline reached')
+        finally:
+            # probes still running have to close their ports before find returns
+            pool.shutdown(wait=True, cancel_futures=True)
+        return found_port, found_kind
+
+    def _find_port(self, deadline):
+        cached_port = self._cache.get('port', '')
+        if cached_port in self._available_ports:
+            kind = self._probe_port(cached_port, deadline)
+            if kind:
+                logger.info('cached port %s is valid', cached_port)
+                return cached_port, kind
+            logger.info('cached port %s is not responding, full scan', cached_port)
+
+        return self._scan_ports([p for p in self._available_ports if p != cached_port], deadline)
+
+    def _find_programmer(self, deadline):
+        if self._mock:
             self._programmer = ArduinoParallel(port=(PortMock()))
             return
 
-        port_str = self._find_parallel_port()
-        if port_str:
-            port = serial.Serial(port=port_str, baudrate=9600, parity=serial.PARITY_NONE, bytesize=8,
-                                 stopbits=serial.STOPBITS_ONE, timeout=0.5)
-            if port:
-                self._programmer = ArduinoParallel(port=port)
-                return
+        port_str, kind = self._find_port(deadline)
+        if not port_str:
+            return
 
-        port_str = self._find_spi_port()
-        if port_str:
-            port = serial.Serial(port=port_str, baudrate=9600, parity=serial.PARITY_NONE, bytesize=8,
-                                 stopbits=serial.STOPBITS_ONE, timeout=0.5)
-            if port:
-                self._programmer = ArduinoSpi(port=port)
+        port = serial.Serial(port=port_str, baudrate=9600, parity=serial.PARITY_NONE, bytesize=8,
+                             stopbits=serial.STOPBITS_ONE, timeout=0.5)
+        if port:
+            self._programmer = ArduinoParallel(port=port) if kind == 'parallel' else ArduinoSpi(port=port)
+            self._programmer_port = port_str, kind
 
     def _find_analyzer(self):
-        if def_mock:
+        if self._mock:
             self._analyzer = Obzor304Mock(self.analyzer_addr)
             return
 
         try:
             self._analyzer = Obzor304(self._analyzer_addr)
         except Exception as ex:
-            print(f'analyzer error: {ex}')
+            logger.warning('analyzer error: %s', ex)
+
+    def find(self, timeout=find_timeout):
+        deadline = time.monotonic() + timeout
+
+        # the analyzer object is replaced below
+        self._session.close()
 
-    def find(self):
         self._find_ports()
-        print(f'available ports: {" ".join(self._available_ports)}')
+        logger.info('available ports: %s', ' '.join(self._available_ports))
 
-        print('find programmer')
-        self._find_programmer()
-        print(f'programmer: {self._programmer}')
+        # VISA connection setup runs alongside the serial port probing
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            logger.debug('find analyzer')
+            analyzer = pool.submit(self._find_analyzer)
 
-        print('find analyzer')
-        try:
-            self._find_analyzer()
-        except Exception as ex:
-            print(ex)
-        print(f'analyzer: {self._analyzer}')
+            logger.debug('find programmer')
+            self._find_programmer(deadline)
+            logger.info('programmer: %s', self._programmer)
+
+            try:
+                analyzer.result()
+            except Exception as ex:
+                logger.warning('analyzer error: %s', ex)
+        logger.info('analyzer: %s', self._analyzer)
+
+        if self._programmer and self._analyzer and not self._mock:
+            self._save_cache(*self._programmer_port)
 
         return self._programmer and self._analyzer
 
@@ -128,12 +218,68 @@ class InstrumentManager:
         # self._programmer.set_lpf_code = self._programmer.set_lpf_code_parallel if parallel else self._programmer.set_lpf_code_spi_s_format_reversed
         self._programmer.set_lpf_code = self._programmer.set_lpf_code_parallel if parallel else self._programmer.set_lpf_code_spi_s_format
 
-    def measure(self, code, address):
+    def set_code(self, code, address):
         if not self._programmer.set_lpf_code(code, address):
-            print(f'error setting code: {code}')
+            logger.warning('error setting code: %s', code)
+            return False
+        return True
+
+    def acquire(self, code):
+        if self._stream_transfer:
+            return self._acquire_stream(code)
+        if self._binary_transfer:
+            return self._acquire_binary(code)
+        # the ASCII path sweeps and transfers in one call
+        return self.timing.time('sweep', code, self._analyzer.measure, code)
+
+    def _acquire_binary(self, code):
+        inst = getattr(self._analyzer, '_inst', None)
+        if inst is None:
+            # mock analyzers have no VISA session
+            freqs, amps = self.timing.time('sweep', code, self._analyzer.measure, code)
+            return encode_block(np.fromstring(freqs, sep=',')), encode_block(np.fromstring(amps, sep=','))
+
+        self.timing.time('sweep', code, inst.query, 'TRIG:SING;*OPC?')
+        with self.timing.stage('transfer', code):
+            return query_block(inst, 'SENS1:FREQ:DATA?'), query_block(inst, 'CALC1:DATA:FDAT?')
+
+    def _acquire_stream(self, code):
+        # the amplitudes come back as a TraceStream parsed chunk by chunk
+        inst = getattr(self._analyzer, '_inst', None)
+        if inst is None:
+            freqs, amps = self.timing.time('sweep', code, self._analyzer.measure, code)
+            if self._binary_transfer:
+                freqs = encode_block(np.fromstring(freqs, sep=','))
+                return freqs, TraceStream(bytes_chunks(encode_block(np.fromstring(amps, sep=','))), binary=True)
+            return freqs, TraceStream(text_chunks(amps))
+
+        self.timing.time('sweep', code, inst.query, 'TRIG:SING;*OPC?')
+        with self.timing.stage('transfer', code):
+            if self._binary_transfer:
+                freqs = query_block(inst, 'SENS1:FREQ:DATA?')
+            else:
+                freqs = inst.query('SENS1:FREQ:DATA?')
+        inst.write('CALC1:DATA:FDAT?')
+        if self._binary_transfer:
+            return freqs, TraceStream(read_block_chunks(inst), binary=True)
+        return freqs, TraceStream(read_ascii_chunks(inst))
+
+    def setup_transfer(self):
+        inst = getattr(self._analyzer, '_inst', None)
+        if self._binary_transfer and inst is not None:
+            inst.write('FORM:DATA REAL')
+            inst.write('FORM:BORD SWAP')
+
+    def reset_transfer(self):
+        inst = getattr(self._analyzer, '_inst', None)
+        if inst is not None:
+            inst.write('FORM:DATA ASC')
+
+    def measure(self, code, address):
+        if not self.set_code(code, address):
             return [], []
         # time.sleep(1)
-        return self._analyzer.measure(code)
+        return self.acquire(code)
 
     @property
     def harmonic(self):
@@ -160,7 +306,7 @@ class InstrumentManager:
         # 2 - тип порт1 -> порт2
         # 3 - порт2: множитель x2, x3
 
-        print('>>> IM set harmonic', value)
+        logger.debug('set harmonic %s', value)
 
     @property
     def analyzer_addr(self):
@@ -170,6 +316,39 @@ class InstrumentManager:
     def analyzer_addr(self, addr):
         self._analyzer_addr = addr
 
+    @property
+    def programmer_port(self):
+        return self._programmer_port[0]
+
+    @property
+    def excluded_ports(self):
+        return self._excluded_ports
+
+    @excluded_ports.setter
+    def excluded_ports(self, ports):
+        self._excluded_ports = set(ports)
+
+    @property
+    def binary_transfer(self):
+        return self._binary_transfer
+
+    @binary_transfer.setter
+    def binary_transfer(self, value):
+        self._binary_transfer = value
+        self._session.configure(binary=value)
+
+    @property
+    def stream_transfer(self):
+        return self._stream_transfer
+
+    @stream_transfer.setter
+    def stream_transfer(self, value):
+        self._stream_transfer = value
+
+    @property
+    def session(self):
+        return self._session
+
     @property
     def isSPI(self):
         return not isinstance(self._programmer, ArduinoParallel)
@@ -193,193 +372,691 @@ class Task(QRunnable):
 class Domain(QObject):
 
     MAXREG = 127
+    HARMONICS = (2, 3)
 
     codeMeasured = pyqtSignal()
     measurementFinished = pyqtSignal()
+    measurementAborted = pyqtSignal(str)
     statsReady = pyqtSignal()
+    statsUpdated = pyqtSignal()
     harmonicMeasured = pyqtSignal()
     harmonicPointMeasured = pyqtSignal()
     singleMeasured = pyqtSignal()
+    singleFinished = pyqtSignal()
+    codeTimed = pyqtSignal(dict)
+    timingReady = pyqtSignal(dict)
 
-    def __init__(self, parent=None):
+    def __init__(self, parent=None, instruments=None):
         super().__init__(parent)
 
-        self._instruments = InstrumentManager()
+        self._instruments = instruments or InstrumentManager()
         self.pool = QThreadPool()
 
         self._code = 0
         self._harmonic = 1
 
+        self._lastCode = 0
+        self._lastStoredCode = 0
         self._lastMeasurement = tuple()
-        self._lastFreqs = list()
-        self._lastAmps = list()
-
-        self.freqs = list()
-        self.amps = list()
-        self.codes = list()
-        self.cutoff_freqs = list()
-        self.loss_double_freq = list()
-        self.loss_triple_freq = list()
-        self.cutoff_freq_delta_x = list()
-        self.cutoff_freq_delta_y = list()
-
-        self.harms = defaultdict(list)
+        self._lastFreqs = np.empty(0)
+        self._lastAmps = np.empty(0)
+
+        self._freqs = SharedAxis(self.MAXREG + 1)
+        self._traceStorage = 'float64'
+        self._amps = TraceMatrix(self.MAXREG + 1, self._traceStorage)
+        self._stats = empty_stats
+
+        # harmonic traces share the storage mode of the base sweep
+        self.harms = defaultdict(lambda: TraceMatrix(self.MAXREG + 1, self._amps.mode))
         self.harm_deltas = defaultdict(list)
 
         self._cutoffMag = -6
         self._cutoffAmp = 0
 
-        self.measurementFinished.connect(self._processStats)
-        self.harmonicPointMeasured.connect(self._processHarmonics)
+        self._boardId = ''
+        self._protocol = 'parallel'
+        self._store = SweepStore()
+        self._sweepPath = ''
+        self._sweepTime = ''
+
+        self._busy = threading.Lock()
+        self._cancel = threading.Event()
+        self._running = threading.Event()
+        self._running.set()
+        self._abortReason = ''
+        self._abortReported = False
+        self._sweepAbortReason = ''
+        self.failRules = list()
+
+        self._singleStop = threading.Event()
+        self._singlePending = threading.Event()
+        self._singleRunning = False
+        self._singleTrace = np.empty(0), np.empty(0)
+        self._singleCached = False
+        self._traceCache = TraceCache()
+        self._sweepSetup = None
+        self._harmAxes = dict()
+        self._sweepStamp = 0.0
+        self._harmStamp = 0.0
+
+        self._sweepMode = 'dense'
+        self._adaptiveStep = 8
+        self._adaptiveTolerance = 0.02
+        self._pipelined = True
+        self._incrementalStats = True
+        self._runningMax = -np.inf
+        self._cutoffByCode = np.full(self.MAXREG + 1, np.nan)
+        self._lossDoubleByCode = np.full(self.MAXREG + 1, np.nan)
+        self._lossTripleByCode = np.full(self.MAXREG + 1, np.nan)
+        self._timing = StageTimer(log_path=timing_log_path)
+        self._timing.listeners.append(self.codeTimed.emit)
+        self._instruments.timing = self._timing
 
     def _clear(self):
-        self._lastFreqs.clear()
-        self._lastAmps.clear()
-        self.freqs.clear()
-        self.amps.clear()
-        self.codes.clear()
-        self.cutoff_freqs.clear()
-        self.loss_double_freq.clear()
-        self.loss_triple_freq.clear()
-        self.cutoff_freq_delta_x.clear()
-        self.cutoff_freq_delta_y.clear()
+        self._lastFreqs = np.empty(0)
+        self._lastAmps = np.empty(0)
+        self._freqs.clear()
+        if self._amps.mode == self._traceStorage:
+            self._amps.clear()
+        else:
+            self._amps = TraceMatrix(self.MAXREG + 1, self._traceStorage)
+        self._stats = empty_stats
         self.harms.clear()
+        self._harmAxes.clear()
         self.harm_deltas.clear()
+        self._sweepPath = ''
+        self._sweepTime = ''
+        self._sweepAbortReason = ''
+        # a new sweep may be a new board under the same id
+        self._traceCache.clear()
+        self._sweepSetup = None
+        self._runningMax = -np.inf
+        self._cutoffByCode[:] = np.nan
+        self._lossDoubleByCode[:] = np.nan
+        self._lossTripleByCode[:] = np.nan
 
     def findInstruments(self):
-        print('find instruments')
-        return self._instruments.find()
+        if not self._claim():
+            return False
+        logger.info('find instruments')
+        self._traceCache.clear()
+        self._sweepSetup = None
+        try:
+            return self._instruments.find()
+        finally:
+            self._busy.release()
+
+    def _claim(self):
+        # one instrument task at a time
+        if self._busy.acquire(blocking=False):
+            return True
+        logger.warning('an instrument task is already running')
+        return False
+
+    def _resetControl(self):
+        self._cancel.clear()
+        self._running.set()
+        self._abortReason = ''
+        self._abortReported = False
+
+    def abort(self, reason='aborted by operator'):
+        logger.info('abort: %s', reason)
+        if not self._cancel.is_set():
+            self._abortReason = reason
+        self._cancel.set()
+        self._running.set()
+
+    def pause(self):
+        logger.info('pause')
+        self._running.clear()
+
+    def resume(self):
+        logger.info('resume')
+        self._running.set()
+
+    def _checkpoint(self):
+        # blocks while paused, False once cancelled
+        while not self._running.wait(0.1):
+            if self._cancel.is_set():
+                break
+        if self._cancel.is_set():
+            self._reportAbort()
+            return False
+        return True
+
+    def _reportAbort(self):
+        if self._abortReason and not self._abortReported:
+            self._abortReported = True
+            self.measurementAborted.emit(self._abortReason)
+
+    def _checkRules(self, code):
+        for rule in self.failRules:
+            reason = rule(self, code)
+            if reason:
+                self.abort(reason)
+                return
+
+    @property
+    def _codeStats(self):
+        # fail rules need the per-code cutoffs
+        return self._incrementalStats or bool(self.failRules)
+
+    def _start(self, task, wait=False):
+        # wait=True runs the task in the calling thread
+        fn = task.fn
 
-    def measure(self):
-        print(f'run measurement, cutoff={self._cutoffMag}')
+        def run(*args, **kwargs):
+            try:
+                fn(*args, **kwargs)
+            except Exception as ex:
+                if wait:
+                    raise
+                # an exception escaping QRunnable.run aborts the application
+                logger.exception('instrument task error')
+                self.measurementAborted.emit(f'error: {ex}')
+            finally:
+                self._busy.release()
+
+        task.fn = run
+        if not wait:
+            self.pool.start(task)
+            return True
+        task.fn(*task.args, **task.kwargs)
+        return True
+
+    def measure(self, wait=False):
+        if not self._claim():
+            return False
+        logger.info('run measurement, cutoff=%s', self._cutoffMag)
         self._clear()
-        self.pool.start(Task(self.measurementFinished.emit, self._measureTask))
+        self._sweepSetup = self._setupKey()
+        self._sweepStamp = time.monotonic()
+        self._resetControl()
+        return self._start(Task(self.measurementFinished.emit, self._sweepTask), wait)
 
     def _measureCode(self, code=0, address=0):
-        print(f'\nmeasure: code={code:03d}, bin={code:07b}')
-        self._lastMeasurement = self._instruments.measure(code, self._instruments._spi_pin_address)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f'measure: code={code:03d}, bin={code:07b}')
+        self._lastCode = code
+        if not self._timing.time('program', code, self._instruments.set_code, code, self._instruments._spi_pin_address):
+            self._lastMeasurement = [], []
+            return
+        self._lastMeasurement = self._instruments.session.acquire(code)
+
+    def _sweepTask(self):
+        try:
+            self._measureTask()
+        finally:
+            self._reportAbort()
+            self._sweepAbortReason = self._abortReason
+            self._processStats()
 
     def _measureTask(self):
-        print('start measurement task')
+        logger.info('start measurement task')
         regs = self.MAXREG + 1
 
         # MOCK
-        if def_mock:
+        if self._instruments._mock:
             regs = 5
 
-        with MeasureContext(self._instruments):
-            for code in range(regs):
-                self._measureCode(code=code, address=self._instruments._spi_pin_address)
-                self._processCode()
-                self.codeMeasured.emit()
-
-        print('end measurement task')
+        self._timing.begin('sweep', self._boardId)
+        self._instruments.session.reset_stats()
 
-    def _parseFreqStr(self, string):
-        return [float(num) for num in string.split(',')]
-
-    def _parseAmpStr(self, string):
-        return [float(num) for idx, num in enumerate(string.split(',')) if idx % 2 == 0]
+        with MeasureContext(self._instruments):
+            # a single measurement may have left the analyzer on a harmonic
+            self._instruments.session.configure(harmonic=1)
+            if self._sweepMode == 'adaptive':
+                self._measureAdaptive(regs)
+            elif self._pipelined:
+                self._measurePipelined(regs)
+            else:
+                for code in range(regs):
+                    if not self._measureAndUpdate(code, self._codeStats):
+                        break
+
+        logger.info('end measurement task')
+
+    def _measureAndUpdate(self, code, stats=True):
+        if not self._checkpoint():
+            return False
+        self._measureCode(code=code, address=self._instruments._spi_pin_address)
+        if not self._lastMeasurement[0]:
+            return True
+        self._timing.time('parse', code, self._processCode)
+        self.codeMeasured.emit()
+        if stats:
+            self._timing.time('stats', code, self._updateStats, code)
+            self._checkRules(code)
+        self._timing.finish(code)
+        return True
+
+    def _measureAdaptive(self, regs):
+        # coarse pass, then bisect the intervals where the cutoff curve is not linear
+        last = regs - 1
+        coarse = sorted(set(range(0, regs, self._adaptiveStep)) | {last})
+        for code in coarse:
+            if not self._measureAndUpdate(code):
+                return
 
-    def _processCode(self):
-        print('processing code measurement')
-        self._lastFreqs = self._parseFreqStr(self._lastMeasurement[0])
-        self._lastAmps = self._parseAmpStr(self._lastMeasurement[1])
+        gaps = list(zip(coarse, coarse[1:]))
+        while gaps:
+            lo, hi = gaps.pop(0)
+            if hi - lo < 2:
+                continue
 
-        self.freqs.append(self._lastFreqs)
-        self.amps.append(self._lastAmps)
+            mid = (lo + hi) // 2
+            if not self._measureAndUpdate(mid):
+                return
 
-    def _processStats(self):
-        print('process stats')
-        max_amp = max(map(max, self.amps))
+            cut = self._cutoffByCode
+            if np.isnan(cut[[lo, mid, hi]]).any():
+                gaps += [(lo, mid), (mid, hi)]
+                continue
 
-        cutoff_mag = max_amp + self._cutoffMag
-        self._cutoffAmp = cutoff_mag
+            expected = cut[lo] + (cut[hi] - cut[lo]) * (mid - lo) / (hi - lo)
+            monotonic = (cut[mid] - cut[lo]) * (cut[hi] - cut[mid]) >= 0
+            if not monotonic or abs(cut[mid] - expected) > self._adaptiveTolerance * abs(cut[mid]):
+                gaps += [(lo, mid), (mid, hi)]
 
-        for a, f in zip(self.amps, self.freqs):
-            cutoff_freq = f[a.index(min(a, key=lambda x: abs(cutoff_mag - x)))]
-            self.cutoff_freqs.append(cutoff_freq)
+        logger.info('adaptive sweep: measured %d of %d codes', self._amps.filled.sum(), regs)
 
-            amp_max = max(a)
+    def _measurePipelined(self, regs):
+        # parsing and plotting of code N overlap with programming and acquisition of code N+1
+        processing = queue.Queue()
+        worker = threading.Thread(target=self._processWorker, args=(processing, ), daemon=True)
+        worker.start()
 
-            double_f = cutoff_freq * 2
-            triple_f = cutoff_freq * 3
-            double_f_index = f.index(min(f, key=lambda x: abs(double_f - x)))
-            triple_f_index = f.index(min(f, key=lambda x: abs(triple_f - x)))
+        try:
+            for code in range(regs):
+                if not self._checkpoint():
+                    break
+                self._measureCode(code=code, address=self._instruments._spi_pin_address)
+                if self.streamTransfer and self._lastMeasurement[0]:
+                    # a streamed trace has to be read before the next trigger
+                    self._timing.time('parse', code, self._processCode, self._lastMeasurement, code)
+                    processing.put((code, None))
+                else:
+                    processing.put((code, self._lastMeasurement))
+        finally:
+            processing.put(None)
+            with self._timing.stage('drain'):
+                worker.join()
+
+    def _processWorker(self, processing):
+        failed = False
+        while True:
+            item = processing.get()
+            if item is None:
+                break
+            code, measurement = item
+            if failed:
+                continue
+            if measurement is not None:
+                if not measurement[0]:
+                    continue
+                try:
+                    self._timing.time('parse', code, self._processCode, measurement, code)
+                except Exception as ex:
+                    logger.warning('error processing code measurement: %s', ex)
+                    continue
+            try:
+                self.codeMeasured.emit()
+                if self._codeStats:
+                    self._timing.time('stats', code, self._updateStats, code)
+                    self._checkRules(code)
+            except Exception as ex:
+                logger.warning('error processing code %s: %s', code, ex)
+                self.abort(f'error processing code {code}: {ex}')
+                failed = True
+            self._timing.finish(code)
+
+    def _reportTiming(self):
+        summary = self._timing.end()
+        if not summary:
+            return
+        if logger.isEnabledFor(logging.INFO):
+            session = self._instruments.session.stats
+            logger.info('%s\nanalyzer session: setup %.3f s, acquisition %.3f s, opened %dx, reconnected %dx',
+                        format_summary(summary), session['setup'], session['acquire'],
+                        session['opens'], session['reconnects'])
+        self.timingReady.emit(summary)
 
-            self.loss_double_freq.append(amp_max - a[double_f_index])
-            self.loss_triple_freq.append(amp_max - a[triple_f_index])
+    def addPlotTime(self, seconds, code=None):
+        self._timing.annotate('plot', seconds, code)
 
-        self.cutoff_freqs = list(reversed(self.cutoff_freqs))
-        # self.loss_double_freq = list(reversed(self.loss_double_freq))
-        # self.loss_triple_freq = list(reversed(self.loss_triple_freq))
-        self.codes = list(range(len(self.cutoff_freqs)))
+    def _parseFreqStr(self, string):
+        if not isinstance(string, str):
+            return parse_block(string)
+        return np.fromstring(string, dtype=np.float64, sep=',')
 
-        for i in range(len(self.cutoff_freqs[:-1])):
-            d = abs(self.cutoff_freqs[i + 1] - self.cutoff_freqs[i])
-            self.cutoff_freq_delta_y.append(d)
+    def _parseAmpStr(self, string):
+        # the analyzer sends interleaved re,im pairs, amplitude is the real part
+        if not isinstance(string, str):
+            return parse_block(string)[::2]
+        return np.fromstring(string, dtype=np.float64, sep=',')[::2]
+
+    def _storeAmps(self, traces, code, amps, points):
+        if not isinstance(amps, TraceStream):
+            return traces.put(code, self._parseAmpStr(amps))
+        row = traces.reserve(code, points)
+        for _ in amps.parse_into(row):
+            pass
+        return traces.commit(code)
+
+    def _processCode(self, measurement=None, code=None):
+        logger.debug('processing code measurement')
+        freqs, amps = measurement or self._lastMeasurement
+        code = self._lastCode if code is None else code
+
+        self._lastFreqs = self._freqs.put(code, freqs, self._parseFreqStr)
+        self._lastAmps = self._storeAmps(self._amps, code, amps, len(self._lastFreqs))
+        self._lastStoredCode = code
+
+    def _setupKey(self):
+        # everything besides code and harmonic that changes what the analyzer sees
+        return (self._boardId, self._protocol, self._instruments._spi_pin_address, self.analyzerAddress,
+                self.sweepPoints)
+
+    def _traceKey(self, code, harmonic):
+        return self._setupKey(), int(code), harmonic
+
+    def _sweepTrace(self, code, harmonic):
+        if self._sweepSetup is None or self._sweepSetup != self._setupKey():
+            return None
+        stamp = self._sweepStamp if harmonic == 1 else self._harmStamp
+        if time.monotonic() - stamp > self._traceCache.ttl:
+            return None
+        if harmonic == 1:
+            if code >= len(self._amps) or not self._amps.filled[code]:
+                return None
+            return self._freqs.row(code), self._amps.row(code)
+        axis = self._harmAxes.get((harmonic, code))
+        if axis is None:
+            return None
+        return axis, self.harms[harmonic].row(code)
+
+    def _processSingle(self):
+        freqs, amps = self._lastMeasurement
+        freqs = self._freqs.parsed(freqs, self._parseFreqStr)
+        self._singleTrace = freqs, amps.read(len(freqs)) if isinstance(amps, TraceStream) else self._parseAmpStr(amps)
+        self._traceCache.put(self._traceKey(self._lastCode, self._harmonic), self._singleTrace)
 
-        self.cutoff_freq_delta_x = list(range(len(self.cutoff_freq_delta_y)))
+    def _processStats(self):
+        logger.info('process stats')
+        measured = self._amps.filled
+        if not measured.any():
+            logger.info('no measured codes')
+            self._reportTiming()
+            self.statsReady.emit()
+            return
 
+        with self._timing.stage('batch'):
+            codes = np.flatnonzero(measured)
+            stats = cutoff_stats(self._freqs.axis(codes), self._amps.take(codes), self._cutoffMag)
+            self._cutoffAmp = stats.cutoff_amp
+            self._cutoffByCode[codes] = stats.cutoff_freqs
+            self._lossDoubleByCode[codes] = stats.loss_double
+            self._lossTripleByCode[codes] = stats.loss_triple
+
+            self._publishStats()
+        with self._timing.stage('persist'):
+            self._persist()
+        self._reportTiming()
         self.statsReady.emit()
 
-    def measureSingle(self):
-        print(f'measure harmonic={self.harmonicN}, code={self.code}')
-        with MeasureContext(self._instruments):
-            self._measureCode(code=self.code, address=self._instruments._spi_pin_address)
-            self._processCode()
-
-        self.singleMeasured.emit()
-
-    def measureHarmonics(self):
-        print(f'run harmonic measurement, cutoff={self._cutoffMag}')
+    def _publishStats(self):
+        # skipped codes are interpolated from their measured neighbours
+        count = len(self._amps)
+        cutoffs = self._cutoffByCode[:count]
+        loss_double = self._lossDoubleByCode[:count]
+        loss_triple = self._lossTripleByCode[:count]
+
+        codes = np.arange(count)
+        interpolated = np.isnan(cutoffs)
+        if interpolated.any() and not interpolated.all():
+            known = np.flatnonzero(~interpolated)
+            cutoffs = np.interp(codes, known, cutoffs[known])
+            loss_double = np.interp(codes, known, loss_double[known])
+            loss_triple = np.interp(codes, known, loss_triple[known])
+
+        cutoff_freqs = cutoffs[::-1].copy()
+        # loss_double_freq = loss_double[::-1]
+        # loss_triple_freq = loss_triple[::-1]
+        delta_y = np.abs(np.diff(cutoff_freqs))
+
+        self._stats = StatsSnapshot(codes, cutoff_freqs, interpolated, loss_double.copy(), loss_triple.copy(),
+                                    np.arange(len(delta_y)), delta_y)
+
+    def _updateStats(self, code):
+        row_max = self._amps.row(code).max()
+        if row_max > self._runningMax:
+            # the cutoff level follows the global maximum
+            self._runningMax = row_max
+            codes = np.flatnonzero(self._amps.filled)
+        else:
+            codes = np.array([code])
+
+        stats = cutoff_stats(self._freqs.axis(codes), self._amps.take(codes), self._cutoffMag, max_amp=self._runningMax)
+        self._cutoffAmp = stats.cutoff_amp
+        self._cutoffByCode[codes] = stats.cutoff_freqs
+        self._lossDoubleByCode[codes] = stats.loss_double
+        self._lossTripleByCode[codes] = stats.loss_triple
+
+        self._publishStats()
+        self.statsUpdated.emit()
+
+    def measureSingle(self, continuous=False, force=False):
+        logger.info('measure harmonic=%s, code=%s, continuous=%s', self.harmonicN, self.code, continuous)
+        self._singleCached = False
+        if not continuous and not force:
+            # a single measurement is newer than the sweep row of its code
+            cached = self._traceCache.get(self._traceKey(self.code, self._harmonic))
+            if cached is None:
+                cached = self._sweepTrace(self.code, self._harmonic)
+            if cached is not None:
+                logger.info('code %s answered from measured data', self.code)
+                self._singleTrace = cached
+                self._singleCached = True
+                self.singleMeasured.emit()
+                self.singleFinished.emit()
+                return True
+
+        if not self._claim():
+            return False
+        self._singleStop.clear()
+        self._singlePending.clear()
+        self._singleRunning = True
+        return self._start(Task(self.singleFinished.emit, self._measureSingleTask, continuous))
+
+    def stopSingle(self):
+        self._singleStop.set()
+
+    def ackSingle(self):
+        self._singlePending.clear()
+
+    def _measureSingleTask(self, continuous):
+        code = None
+        try:
+            with MeasureContext(self._instruments):
+                while True:
+                    if code != self.code:
+                        code = self.code
+                        self._lastCode = code
+                        if not self._instruments.set_code(code, self._instruments._spi_pin_address):
+                            break
+                    self._instruments.session.configure(harmonic=self._harmonic)
+
+                    self._lastMeasurement = self._instruments.session.acquire(code)
+                    self._processSingle()
+
+                    # only the newest frame is announced
+                    if not self._singlePending.is_set():
+                        self._singlePending.set()
+                        self.singleMeasured.emit()
+
+                    if not continuous or self._singleStop.is_set():
+                        break
+        finally:
+            self._singleRunning = False
+
+    def measureHarmonics(self, wait=False):
+        if not self._claim():
+            return False
+        logger.info('run harmonic measurement, cutoff=%s', self._cutoffMag)
 
         self.harms.clear()
+        self._harmAxes.clear()
         self.harm_deltas.clear()
-        self.pool.start(Task(self.harmonicPointMeasured.emit, self._measureHarmonicTask))
+        self._traceCache.clear()
+        self._harmStamp = time.monotonic()
+        self._resetControl()
+        return self._start(Task(self.harmonicPointMeasured.emit, self._measureHarmonicTask), wait)
 
     def _measureHarmonicTask(self):
-        print(f'start harmonic measurement task')
-        regs = self.MAXREG + 1
+        logger.info('start harmonic measurement task')
+        # only codes of the last sweep are re-visited
+        codes = np.flatnonzero(self._amps.filled)
 
-        # MOCK
-        if def_mock:
-            regs = 5
+        self._timing.begin('harmonics', self._boardId)
+        self._instruments.session.reset_stats()
 
-        with MeasureContext(self._instruments):
-            for harm in [2, 3]:
-                self._instruments.harmonic = harm
-                for code in range(regs):
-                    self._measureCode(code=code)
-                    self._processHarmonicCode(harm)
+        try:
+            with MeasureContext(self._instruments):
+                for code in codes:
+                    if not self._checkpoint():
+                        break
+                    self._measureHarmonicCode(code)
+                self._instruments.session.configure(harmonic=1)
+        finally:
+            self._reportAbort()
+            try:
+                with self._timing.stage('batch'):
+                    self._processHarmonics()
+                with self._timing.stage('persist'):
+                    self._persist()
+                self._reportTiming()
+            finally:
+                self.harmonicMeasured.emit()
+        logger.info('end harmonic measurement task')
+
+    def _measureHarmonicCode(self, code):
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f'measure harmonics: code={code:03d}, bin={code:07b}')
+        self._lastCode = code
+        if not self._timing.time('program', code, self._instruments.set_code, code, self._instruments._spi_pin_address):
+            return
 
-        self._processHarmonics()
-        self.harmonicMeasured.emit()
-        print('end harmonic measurement task')
+        for harm in self.HARMONICS:
+            self._instruments.session.configure(harmonic=harm)
+            self._lastMeasurement = self._instruments.session.acquire(code)
+            self._timing.time('parse', code, self._processHarmonicCode, harm)
+        self._timing.finish(code)
 
     def _processHarmonicCode(self, n):
-        print('processing code measurement')
-        self.harms[n].append(self._parseAmpStr(self._lastMeasurement[1]))
+        logger.debug('processing harmonic measurement')
+        freqs, amps = self._lastMeasurement
+        freqs = self._freqs.parsed(freqs, self._parseFreqStr)
+        self._storeAmps(self.harms[n], self._lastCode, amps, len(freqs))
+        self._harmAxes[(n, self._lastCode)] = freqs
 
     def _processHarmonics(self):
-        print(f'processing harmonic stats')
+        logger.debug('processing harmonic stats')
+        base_max = self.amps.max(axis=1)
         for key, harms in self.harms.items():
-            for base, harm in zip(self.amps, harms):
-                self.harm_deltas[key].append(max(base) - max(harm))
+            deltas = np.full(len(base_max), np.nan)
+            count = min(len(base_max), len(harms))
+            deltas[:count] = base_max[:count] - harms.data[:count].max(axis=1)
+            self.harm_deltas[key] = deltas
+
+    def _persist(self):
+        if self._store is None or not len(self._amps):
+            return
+
+        # the harmonic pass adds its columns to the same sweep
+        if not self._sweepPath:
+            self._sweepPath = self._store.new_path(self._boardId)
+            self._sweepTime = time.strftime('%Y-%m-%d %H:%M:%S')
+
+        count = len(self._amps)
+        meta = {
+            'board': self._boardId,
+            'timestamp': self._sweepTime,
+            'cutoff_mag': self._cutoffMag,
+            'cutoff_amp': float(self._cutoffAmp),
+            'protocol': self._protocol,
+            'spi_pin_address': self._instruments._spi_pin_address,
+            'analyzer': self.analyzerAddress,
+            'programmer': self.programmerName,
+            'sweep_mode': self._sweepMode,
+            'codes': count,
+            'points': self._amps.points,
+            'trace_storage': self._amps.mode,
+            'abort_reason': self._sweepAbortReason,
+        }
+        columns = {
+            'freqs': self._freqs.axis(),
+            'amps': self._amps.raw,
+            'filled': self._amps.filled,
+            'cutoff': self._cutoffByCode[:count],
+            'loss_x2': self._lossDoubleByCode[:count],
+            'loss_x3': self._lossTripleByCode[:count],
+            'interpolated': self._stats.interpolated,
+        }
+        for n, harms in self.harms.items():
+            columns[f'harm{n}'] = harms.raw
+            columns[f'harm_delta{n}'] = self.harm_deltas[n]
+
+        try:
+            self._store.save(self._sweepPath, meta, columns)
+            logger.info('sweep saved to %s', self._store.resolve(self._sweepPath))
+        except (OSError, ValueError) as ex:
+            logger.warning('error saving sweep: %s', ex)
+
+    def closeSession(self):
+        self._instruments.session.close()
 
     def setSpiProtocol(self, parallel=False):
+        self._protocol = 'parallel' if parallel else 'serial'
         self._instruments.set_spi_protocol(parallel)
 
     def setSpiPinAddress(self, addr: str):
         self._instruments._spi_pin_address = int(addr)
 
+    @property
+    def freqs(self):
+        return self._freqs.data
+
+    @property
+    def amps(self):
+        return self._amps.data
+
+    @property
+    def boardId(self):
+        return self._boardId
+
+    @boardId.setter
+    def boardId(self, value):
+        self._boardId = value
+
+    @property
+    def store(self):
+        return self._store
+
+    @store.setter
+    def store(self, store):
+        self._store = store
+
+    @property
+    def sweepPath(self):
+        return self._sweepPath
+
     @property
     def analyzerAddress(self):
         return self._instruments.analyzer_addr
 
     @analyzerAddress.setter
     def analyzerAddress(self, addr):
-        print(f'set analyzer address {addr}')
+        logger.info('set analyzer address %s', addr)
         self._instruments.analyzer_addr = addr
 
     @property
@@ -402,6 +1079,10 @@ class Domain(QObject):
     def canMeasure(self):
         return self._instruments._analyzer and self._instruments._programmer
 
+    @property
+    def lastStoredCode(self):
+        return self._lastStoredCode
+
     @property
     def lastXs(self):
         return self._lastFreqs
@@ -410,6 +1091,38 @@ class Domain(QObject):
     def lastYs(self):
         return self._lastAmps
 
+    @property
+    def stats(self):
+        return self._stats
+
+    @property
+    def codes(self):
+        return self._stats.codes
+
+    @property
+    def cutoff_freqs(self):
+        return self._stats.cutoff_freqs
+
+    @property
+    def interpolated(self):
+        return self._stats.interpolated
+
+    @property
+    def loss_double_freq(self):
+        return self._stats.loss_double_freq
+
+    @property
+    def loss_triple_freq(self):
+        return self._stats.loss_triple_freq
+
+    @property
+    def cutoff_freq_delta_x(self):
+        return self._stats.cutoff_freq_delta_x
+
+    @property
+    def cutoff_freq_delta_y(self):
+        return self._stats.cutoff_freq_delta_y
+
     @property
     def cutoffXs(self):
         return self.codes
@@ -418,6 +1131,10 @@ class Domain(QObject):
     def cutoffYs(self):
         return self.cutoff_freqs
 
+    @property
+    def cutoffInterpolated(self):
+        return self.interpolated[::-1]
+
     @property
     def deltaXs(self):
         return self.cutoff_freq_delta_x
@@ -434,6 +1151,10 @@ class Domain(QObject):
     def lossDoubleYs(self):
         return self.loss_double_freq
 
+    @property
+    def harmonicXs(self):
+        return np.arange(len(self._amps))
+
     @property
     def lossTripleXs(self):
         return self.codes
@@ -444,11 +1165,27 @@ class Domain(QObject):
 
     @property
     def singleMeasureXs(self):
-        return self._lastFreqs
+        return self._singleTrace[0]
 
     @property
     def singleMeasureYs(self):
-        return self._lastAmps
+        return self._singleTrace[1]
+
+    @property
+    def singleCached(self):
+        return self._singleCached
+
+    @property
+    def traceCache(self):
+        return self._traceCache
+
+    @property
+    def singleRunning(self):
+        return self._singleRunning
+
+    @property
+    def busy(self):
+        return self._busy.locked()
 
     @property
     def harmonicN(self):
@@ -466,6 +1203,115 @@ class Domain(QObject):
     def code(self, value):
         self._code = value
 
+    @property
+    def persistentSession(self):
+        return self._instruments.session.persistent
+
+    @persistentSession.setter
+    def persistentSession(self, value):
+        self._instruments.session.persistent = value
+
+    @property
+    def sweepPoints(self):
+        return self._instruments.session._wanted['points']
+
+    @sweepPoints.setter
+    def sweepPoints(self, value):
+        self._instruments.session.configure(points=value)
+
+    @property
+    def sessionStats(self):
+        return self._instruments.session.stats
+
+    @property
+    def binaryTransfer(self):
+        return self._instruments.binary_transfer
+
+    @binaryTransfer.setter
+    def binaryTransfer(self, value):
+        self._instruments.binary_transfer = value
+
+    @property
+    def streamTransfer(self):
+        return self._instruments.stream_transfer
+
+    @streamTransfer.setter
+    def streamTransfer(self, value):
+        self._instruments.stream_transfer = value
+
+    @property
+    def traceStorage(self):
+        return self._traceStorage
+
+    @traceStorage.setter
+    def traceStorage(self, mode):
+        # takes effect with the next sweep, the traces of the current one stay as they are
+        if mode not in storage_modes:
+            raise ValueError(f'unknown trace storage mode: {mode}')
+        self._traceStorage = mode
+
+    @property
+    def sweepMode(self):
+        return self._sweepMode
+
+    @sweepMode.setter
+    def sweepMode(self, value):
+        if value not in ('dense', 'adaptive'):
+            raise ValueError(f'unknown sweep mode: {value}')
+        self._sweepMode = value
+
+    @property
+    def adaptiveStep(self):
+        return self._adaptiveStep
+
+    @adaptiveStep.setter
+    def adaptiveStep(self, value):
+        self._adaptiveStep = value
+
+    @property
+    def adaptiveTolerance(self):
+        return self._adaptiveTolerance
+
+    @adaptiveTolerance.setter
+    def adaptiveTolerance(self, value):
+        self._adaptiveTolerance = value
+
+    @property
+    def pipelined(self):
+        return self._pipelined
+
+    @pipelined.setter
+    def pipelined(self, value):
+        self._pipelined = value
+
+    @property
+    def abortReason(self):
+        return self._abortReason
+
+    @property
+    def cutoffByCode(self):
+        return self._cutoffByCode
+
+    @property
+    def incrementalStats(self):
+        return self._incrementalStats
+
+    @incrementalStats.setter
+    def incrementalStats(self, value):
+        self._incrementalStats = value
+
+    @property
+    def stageTimes(self):
+        return self._timing.totals()
+
+    @property
+    def timingLog(self):
+        return self._timing.log_path
+
+    @timingLog.setter
+    def timingLog(self, path):
+        self._timing.log_path = path
+
     @property
     def cutoffAmp(self):
         return self._cutoffAmp
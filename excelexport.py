@@ -0,0 +1,157 @@
+import logging
+import os
+
+import numpy as np
+import xlsxwriter
+
+from PyQt5.QtCore import QObject, pyqtSignal, QThreadPool
+
+from domain import Task
+from sweepstore import safe_name
+
+logger = logging.getLogger(__name__)
+
+excel_path = os.path.join('.', 'excel')
+
+# rows between progress reports while writing the raw trace sheet
+progress_step = 100
+
+
+def snapshot(domain):
+    # copies of everything the workbook needs, the export runs while the next board is measured
+    measured = np.flatnonzero(domain._amps.filled)
+    # published snapshots are never modified, they need no copy
+    stats = domain.stats
+    return {
+        'board': domain.boardId,
+        'codes': stats.codes,
+        'cutoff': stats.cutoff_freqs,
+        'delta_x': stats.cutoff_freq_delta_x,
+        'delta': stats.cutoff_freq_delta_y,
+        'loss_x2': stats.loss_double_freq,
+        'loss_x3': stats.loss_triple_freq,
+        'harm_x': np.array(domain.harmonicXs),
+        'harm_x2': np.array(domain.harm_deltas.get(2, [])),
+        'harm_x3': np.array(domain.harm_deltas.get(3, [])),
+        'raw_codes': measured,
+        'raw_freqs': np.array(domain.freqs[measured[0]]) if len(measured) else np.empty(0),
+        'raw_amps': np.array(domain.amps[measured]),
+    }
+
+
+def _add_chart(wb, ws, sheet, rows, xname, series, yname, cell):
+    chart = wb.add_chart({'type': 'scatter', 'subtype': 'smooth'})
+    for col in series:
+        letter = chr(ord('A') + col)
+        chart.add_series({
+            'name': f"='{sheet}'!${letter}$1",
+            'categories': f"='{sheet}'!$A$2:$A${rows + 1}",
+            'values': f"='{sheet}'!${letter}$2:${letter}${rows + 1}"
+        })
+    chart.set_x_axis({'name': xname})
+    chart.set_y_axis({'name': yname})
+    ws.insert_chart(cell, chart)
+
+
+def _write_table(wb, sheet, header, columns, yname, chart_cell):
+    # constant_memory mode flushes each finished row, so tables are written row by row
+    ws = wb.add_worksheet(sheet)
+    ws.write_row(0, 0, header)
+
+    rows = min(len(c) for c in columns)
+    for row, values in enumerate(zip(*[c[:rows].tolist() for c in columns])):
+        ws.write_row(row + 1, 0, values)
+
+    _add_chart(wb, ws, sheet, rows, header[0], range(1, len(columns)), yname, chart_cell)
+
+
+def write_workbook(path, data, progress=None):
+    raw_rows = len(data['raw_freqs'])
+    total = 5 + raw_rows
+    done = 0
+
+    def report(step=1):
+        nonlocal done
+        done += step
+        if progress:
+            progress(done, total)
+
+    wb = xlsxwriter.Workbook(path, {'constant_memory': True, 'nan_inf_to_errors': True})
+
+    _write_table(wb, 'Частота среза', ['Код', 'Частота среза'], [data['codes'], data['cutoff']],
+                 'Частота среза', 'D3')
+    report()
+    _write_table(wb, 'Дельта', ['Код', 'Дельта'], [data['delta_x'], data['delta']],
+                 'Дельта', 'D3')
+    report()
+    _write_table(wb, 'Затухание x2', ['Код', 'Затухание при x2 частоте'], [data['codes'], data['loss_x2']],
+                 'Затухание при x2 частоте', 'D3')
+    report()
+    _write_table(wb, 'Затухание x3', ['Код', 'Затухание при x3 частоте'], [data['codes'], data['loss_x3']],
+                 'Затухание при x3 частоте', 'D3')
+    report()
+    _write_table(wb, 'Гармоники', ['Код', 'Подавление x2', 'Подавление х3'],
+                 [data['harm_x'], data['harm_x2'], data['harm_x3']], 'Подавление гармоник', 'F3')
+    report()
+
+    # raw traces: one row per frequency point, one column per measured code
+    ws = wb.add_worksheet('АЧХ')
+    ws.write_row(0, 0, ['Частота'] + [f'Код {code}' for code in data['raw_codes']])
+    amps = data['raw_amps'].T
+    for row in range(raw_rows):
+        ws.write(row + 1, 0, data['raw_freqs'][row])
+        ws.write_row(row + 1, 1, amps[row].tolist())
+        if (row + 1) % progress_step == 0:
+            report(progress_step)
+    report(raw_rows % progress_step)
+
+    wb.close()
+    return path
+
+
+def write_single(path, freqs, amps, code):
+    wb = xlsxwriter.Workbook(path, {'nan_inf_to_errors': True})
+    ws = wb.add_worksheet('Sheet1')
+
+    ws.write_row(0, 0, ['Частота', 'Амплитуда', 'Код'])
+    ws.write(1, 2, code)
+    ws.write_column(1, 0, np.asarray(freqs).tolist())
+    ws.write_column(1, 1, np.asarray(amps).tolist())
+
+    _add_chart(wb, ws, 'Sheet1', len(freqs), 'Частота', [1], 'АЧХ', 'F3')
+    wb.close()
+    return path
+
+
+class ExcelExporter(QObject):
+
+    progress = pyqtSignal(int, int)
+    finished = pyqtSignal(str)
+    failed = pyqtSignal(str)
+
+    def __init__(self, parent=None, path=excel_path):
+        super().__init__(parent)
+        self._path = path
+        self._pool = QThreadPool.globalInstance()
+
+    def _file(self, name):
+        os.makedirs(self._path, exist_ok=True)
+        return os.path.join(self._path, name)
+
+    def _run(self, fn, *args):
+        try:
+            self.finished.emit(fn(*args))
+        except Exception as ex:
+            logger.warning('excel export error: %s', ex)
+            self.failed.emit(str(ex))
+
+    def export(self, domain):
+        logger.info('export to excel')
+        data = snapshot(domain)
+        path = self._file(f'{safe_name(data["board"]) or "измерения"}.xlsx')
+        self._pool.start(Task(lambda: None, self._run, write_workbook, path, data, self.progress.emit))
+
+    def exportSingle(self, domain):
+        path = self._file('ачх_от_кода.xlsx')
+        freqs, amps = np.array(domain.singleMeasureXs), np.array(domain.singleMeasureYs)
+        self._pool.start(Task(lambda: None, self._run, write_single, path, freqs, amps, domain.code))
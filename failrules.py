@@ -0,0 +1,37 @@
+import numpy as np
+
+# early-fail rules are called after every processed code as rule(domain, code),
+# a non-empty return value is the reason the sweep gets aborted
+
+
+def _at(value, code):
+    return value[code] if np.ndim(value) else value
+
+
+def cutoff_window(low, high):
+    # low/high are either scalars or per-code sequences, in Hz
+    def rule(domain, code):
+        cutoff = domain.cutoffByCode[code]
+        if np.isnan(cutoff):
+            return ''
+        lo, hi = _at(low, code), _at(high, code)
+        if not lo <= cutoff <= hi:
+            return f'code {code}: cutoff {cutoff:.0f} Hz is outside [{lo:.0f}, {hi:.0f}] Hz'
+        return ''
+    return rule
+
+
+def monotonic_cutoff(tolerance=0.0):
+    # tolerance is the allowed step against the trend, relative to the cutoff frequency
+    def rule(domain, code):
+        cutoffs = domain.cutoffByCode[:code + 1]
+        codes = np.flatnonzero(~np.isnan(cutoffs))
+        steps = np.diff(cutoffs[codes])
+        trend = steps[steps != 0]
+        if len(trend) < 2:
+            return ''
+        bad = np.flatnonzero(steps * np.sign(trend[0]) < -tolerance * cutoffs[codes[:-1]])
+        if len(bad):
+            return f'code {codes[bad[0] + 1]}: cutoff is not monotonic versus code'
+        return ''
+    return rule
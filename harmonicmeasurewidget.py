@@ -40,7 +40,7 @@ class HarmonicMeasureWidget(QWidget):
     def plot(self):
         print(f'plotting harmonic deltas')
         for key, values in self._domain.harm_deltas.items():
-            self._plot.plot(self._domain.codes, values, label=f'f x {key}')
+            self._plot.plot(self._domain.harmonicXs, values, label=f'f x {key}')
         self._plot.legend()
 
 
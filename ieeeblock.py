@@ -0,0 +1,48 @@
+import numpy as np
+
+# IEEE 488.2 definite length block: #<n><len><payload>, n is the digit count of len,
+# the analyzer sends REAL64 values, FORM:BORD SWAP makes them little-endian
+block_dtype = np.dtype('<f8')
+
+
+def parse_block(raw, dtype=block_dtype):
+    view = memoryview(raw)
+    start = bytes(view[:16]).find(b'#')
+    if start < 0:
+        raise ValueError('not an IEEE 488.2 block')
+
+    digits = int(bytes(view[start + 1:start + 2]))
+    if digits == 0:
+        # indefinite length block, payload runs up to the terminator
+        payload = view[start + 2:]
+        payload = payload[:len(payload) - len(payload) % dtype.itemsize]
+    else:
+        length = int(bytes(view[start + 2:start + 2 + digits]))
+        payload = view[start + 2 + digits:start + 2 + digits + length]
+        if len(payload) != length:
+            raise ValueError(f'truncated block: expected {length} bytes, got {len(payload)}')
+
+    return np.frombuffer(payload, dtype=dtype)
+
+
+def encode_block(values, dtype=block_dtype):
+    payload = np.ascontiguousarray(values, dtype=dtype).tobytes()
+    length = str(len(payload)).encode()
+    return b'#' + str(len(length)).encode() + length + payload
+
+
+def query_block(inst, command):
+    # read_raw() stops at the first termination byte, REAL64 payloads hold them,
+    # so the payload is read by the length from the block header
+    inst.write(command)
+    head = inst.read_bytes(2)
+    digits = int(head[1:2])
+    if digits == 0:
+        # indefinite length block, only the terminator marks its end
+        return head + inst.read_raw()
+
+    length = inst.read_bytes(digits)
+    payload = inst.read_bytes(int(length))
+    # trailing newline after the block
+    inst.read_bytes(1)
+    return head + length + payload
@@ -0,0 +1,158 @@
+import logging
+import os
+import threading
+
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from PyQt5.QtCore import QObject, pyqtSignal
+
+logger = logging.getLogger(__name__)
+
+image_path = os.path.join('.', 'image')
+
+
+def snapshot(domain):
+    measured = np.flatnonzero(domain._amps.filled)
+    stats = domain.stats
+    return {
+        'cutoff_mag': domain.cutoffMag,
+        'cutoff_amp': float(domain.cutoffAmp),
+        'freqs': np.array(domain.freqs[measured[0]]) if len(measured) else np.empty(0),
+        'amps': np.array(domain.amps[measured]),
+        'codes': stats.codes,
+        'cutoff': stats.cutoff_freqs,
+        'delta_x': stats.cutoff_freq_delta_x,
+        'delta': stats.cutoff_freq_delta_y,
+        'loss_x2': stats.loss_double_freq,
+        'loss_x3': stats.loss_triple_freq,
+    }
+
+
+def _axes(title, xlabel, ylabel, xscale='linear', yscale='linear', minor_grid=False):
+    # worker processes draw with the plain Agg canvas, no Qt and no pyplot state
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+    fig = Figure()
+    FigureCanvasAgg(fig)
+    fig.subplots_adjust(bottom=0.150)
+    ax = fig.add_subplot(111)
+    ax.set_title(title)
+    ax.set_xscale(xscale)
+    ax.set_yscale(yscale)
+    ax.set_xlabel(xlabel, labelpad=-2)
+    ax.set_ylabel(ylabel, labelpad=-2)
+    if minor_grid:
+        ax.grid(True, which='minor', color='0.7', linestyle='--')
+    ax.grid(True, which='major', color='0.5', linestyle='-')
+    return fig, ax
+
+
+def _render_stats(data):
+    fig, ax = _axes('Коэффициент преобразования', 'F, Гц', 'К-т пр., дБ', xscale='log', minor_grid=True)
+    for amps in data['amps']:
+        ax.plot(data['freqs'], amps, color='0.4')
+    ax.axhline(data['cutoff_amp'], 0, 1, linewidth=0.8, color='0.3', linestyle='--')
+    return fig
+
+
+def _render_cutoff(data):
+    fig, ax = _axes(f'Частота среза по уровню {data["cutoff_mag"]} дБ', 'Код', 'F, МГц', yscale='log', minor_grid=True)
+    ax.plot(data['codes'], data['cutoff'], color='0.4')
+    return fig
+
+
+def _render_delta(data):
+    fig, ax = _axes('Дельта частоты среза', 'Код', 'dF, МГц')
+    ax.plot(data['delta_x'], data['delta'], color='0.4')
+    return fig
+
+
+def _render_loss(data):
+    fig, ax = _axes('Затухание на x2 и x3 частоте среза', 'Код', 'Подавление, дБ')
+    ax.plot(data['codes'], data['loss_x2'], color='0.4')
+    ax.plot(data['codes'], data['loss_x3'], color='0.4')
+    return fig
+
+
+renderers = {
+    'stats': _render_stats,
+    'cutoff': _render_cutoff,
+    'delta': _render_delta,
+    'double-triple': _render_loss,
+}
+
+
+# only the trace plot needs the codes x points matrix, the others get the per-code series
+trace_renderers = {'stats'}
+
+
+def payload(name, data):
+    if name in trace_renderers:
+        return data
+    return {key: value for key, value in data.items() if key != 'amps'}
+
+
+def render(name, data, path, fmt='png', dpi=400):
+    fname = os.path.join(path, f'{name}.{fmt}')
+    renderers[name](data).savefig(fname, format=fmt, dpi=dpi)
+    return fname
+
+
+class ImageExporter(QObject):
+
+    finished = pyqtSignal(str)
+    failed = pyqtSignal(str)
+
+    def __init__(self, parent=None, path=image_path, fmt='png', dpi=400):
+        super().__init__(parent)
+        self.path = path
+        self.fmt = fmt
+        self.dpi = dpi
+        self._executor = None
+
+    def _pool(self):
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=len(renderers))
+        return self._executor
+
+    def export(self, domain):
+        logger.info('saving images')
+        try:
+            os.makedirs(self.path, exist_ok=True)
+        except OSError:
+            self.failed.emit('Error creating image dir.')
+            return
+
+        data = snapshot(domain)
+        futures = [self._pool().submit(render, name, payload(name, data), self.path, self.fmt, self.dpi)
+                   for name in renderers]
+        remaining = len(futures)
+        errors = list()
+        lock = threading.Lock()
+
+        # done callbacks run on the executor's thread, or right here for a future that is already done,
+        # so the counter is shared between threads; the signals are queued to the receivers
+        def done(future):
+            nonlocal remaining
+            with lock:
+                if future.exception():
+                    errors.append(str(future.exception()))
+                remaining -= 1
+                if remaining:
+                    return
+            if errors:
+                logger.warning('image export error: %s', errors[0])
+                self.failed.emit(errors[0])
+            else:
+                self.finished.emit(self.path)
+
+        for future in futures:
+            future.add_done_callback(done)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
@@ -0,0 +1,126 @@
+import time
+
+import numpy as np
+
+from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg, NavigationToolbar2QT
+from matplotlib.collections import LineCollection
+from matplotlib.figure import Figure
+from PyQt5.QtCore import QTimer, pyqtSignal
+from PyQt5.QtWidgets import QVBoxLayout, QWidget
+
+
+def decimate(xs, rows, width, log=False):
+    # min/max per pixel column: two points per column keep the visual envelope of each trace
+    points = len(xs)
+    if width <= 0 or points <= 2 * width:
+        return xs, rows
+
+    scale = np.log10(xs) if log else xs
+    edges = np.linspace(scale[0], scale[-1], width + 1)
+    starts = np.unique(np.searchsorted(scale, edges[:-1]))
+    starts = starts[starts < points]
+
+    lo = np.minimum.reduceat(rows, starts, axis=1)
+    hi = np.maximum.reduceat(rows, starts, axis=1)
+
+    dec_x = np.repeat(xs[starts], 2)
+    dec_y = np.empty((len(rows), 2 * len(starts)))
+    dec_y[:, 0::2] = lo
+    dec_y[:, 1::2] = hi
+    return dec_x, dec_y
+
+
+class LivePlotWidget(QWidget):
+    # trace overlay for the running sweep: all traces live in one LineCollection,
+    # updates are coalesced to at most `fps` redraws per second, every redraw reports its duration in `flushed`
+
+    flushed = pyqtSignal(float)
+
+    def __init__(self, parent=None, toolbar=True, fps=10):
+        super().__init__(parent)
+
+        self._figure = Figure()
+        self._canvas = FigureCanvasQTAgg(self._figure)
+        self._axes = self._figure.add_subplot(111)
+
+        self._layout = QVBoxLayout()
+        if toolbar:
+            self._layout.addWidget(NavigationToolbar2QT(self._canvas, self))
+        self._layout.addWidget(self._canvas)
+        self.setLayout(self._layout)
+
+        self._xs = np.empty(0)
+        self._rows = np.empty((0, 0))
+        self._collection = None
+        self._addCollection()
+
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.setInterval(1000 // fps)
+        self._timer.timeout.connect(self._flush)
+
+    def __getattr__(self, name):
+        # everything else goes straight to the axes, like PlotWidget does
+        if name.startswith('_'):
+            raise AttributeError(name)
+        attr = getattr(self._axes, name)
+        if not callable(attr):
+            return attr
+
+        def call(*args, **kwargs):
+            result = attr(*args, **kwargs)
+            self._canvas.draw_idle()
+            return result
+        return call
+
+    def _addCollection(self):
+        self._collection = LineCollection([], colors='0.4', linewidths=1)
+        self._axes.add_collection(self._collection)
+
+    def setData(self, xs, rows):
+        # rows may also be a function returning them, it is called once per redraw and not once per update
+        self._xs = xs
+        self._rows = rows
+        if not self._timer.isActive():
+            self._timer.start()
+
+    def _flush(self):
+        rows = self._rows() if callable(self._rows) else self._rows
+        if not len(rows) or not len(self._xs):
+            return
+        start = time.perf_counter()
+
+        width = int(self._axes.bbox.width)
+        xs, ys = decimate(self._xs, rows, width, log=self._axes.get_xscale() == 'log')
+        self._collection.set_segments(np.stack(np.broadcast_arrays(xs, ys), axis=-1))
+
+        y_min, y_max = np.nanmin(ys), np.nanmax(ys)
+        margin = (y_max - y_min) * 0.05 or 1
+        self._axes.set_xlim(xs[0], xs[-1])
+        self._axes.set_ylim(y_min - margin, y_max + margin)
+        # drawn right here, the timer already limits the rate and the duration is the real cost
+        self._canvas.draw()
+        self.flushed.emit(time.perf_counter() - start)
+
+    def grid(self, b=None, **kwargs):
+        self._axes.grid(b, **kwargs)
+
+    def subplots_adjust(self, *args, **kwargs):
+        self._figure.subplots_adjust(*args, **kwargs)
+
+    def clear(self):
+        self._timer.stop()
+        self._xs = np.empty(0)
+        self._rows = np.empty((0, 0))
+        self._axes.clear()
+        self._addCollection()
+        self._canvas.draw_idle()
+
+    def axhline(self, *args, **kwargs):
+        self._flush()
+        line = self._axes.axhline(*args, **kwargs)
+        self._canvas.draw_idle()
+        return line
+
+    def savefig(self, *args, **kwargs):
+        self._figure.savefig(*args, **kwargs)
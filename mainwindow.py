@@ -1,7 +1,4 @@
-import errno
-import os
 import subprocess
-import xlsxwriter
 
 from PyQt5 import uic
 from PyQt5.QtGui import QRegularExpressionValidator
@@ -9,9 +6,12 @@ from PyQt5.QtWidgets import QMainWindow, QMessageBox
 from PyQt5.QtCore import Qt, pyqtSlot, QRegularExpression
 
 from domain import Domain
+from excelexport import ExcelExporter
+from imageexport import ImageExporter
 from harmonicmeasurewidget import HarmonicMeasureWidget
 from singlemeasurewidget import SingleMeasureWidget
 from statplotwidget import StatPlotWidget
+from waterfallwidget import WaterfallWidget
 
 
 class MainWindow(QMainWindow):
@@ -26,6 +26,9 @@ class MainWindow(QMainWindow):
         self._ui = uic.loadUi("mainwindow.ui", self)
 
         self._domain = Domain(parent=self)
+        self._plotCode = None
+        self._excel = ExcelExporter(parent=self)
+        self._images = ImageExporter(parent=self)
 
         self._ui.singleMeasure = SingleMeasureWidget(parent=self, domain=self._domain)
         self._ui.layHarmonic.addLayout(self._ui.layCode)
@@ -34,8 +37,11 @@ class MainWindow(QMainWindow):
         self._ui.statPlot = StatPlotWidget(parent=self, domain=self._domain)
         self._ui.tabwidgetCharts.insertTab(0, self._ui.statPlot, 'Измерения')
 
+        self._ui.waterfall = WaterfallWidget(parent=self, domain=self._domain)
+        self._ui.tabwidgetCharts.insertTab(1, self._ui.waterfall, 'Карта')
+
         self._ui.harmonicMeasure = HarmonicMeasureWidget(parent=self, domain=self._domain)
-        self._ui.tabwidgetCharts.insertTab(1, self._ui.harmonicMeasure, 'Гармоники')
+        self._ui.tabwidgetCharts.insertTab(2, self._ui.harmonicMeasure, 'Гармоники')
 
         self._init()
 
@@ -43,6 +49,7 @@ class MainWindow(QMainWindow):
         self._ui.editAnalyzerAddr.setValidator(QRegularExpressionValidator(QRegularExpression(
             '^TCPIP::(([0-9]|[1-9][0-9]|1[0-9]{2}|2[0-4][0-9]|25[0-5])\.){3}'
             '([0-9]|[1-9][0-9]|1[0-9]{2}|2[0-4][0-9]|25[0-5])::INSTR$')))
+        self._ui.editAnalyzerAddr.setText(self._domain.analyzerAddress)
 
         self._setupSignals()
         self._setupControls()
@@ -52,8 +59,18 @@ class MainWindow(QMainWindow):
         self._ui.harmonicMeasure.btnMeasure.clicked.connect(self.on_btnMeasureHarmonic_clicked)
         self._domain.statsReady.connect(self.on_statsReady)
         self._domain.codeMeasured.connect(self.on_codeMeasured)
+        self._domain.statsUpdated.connect(self.on_statsUpdated)
+        self._domain.measurementAborted.connect(self.on_measurementAborted)
+        self._excel.progress.connect(self.on_excelProgress)
+        self._excel.finished.connect(self.on_excelFinished)
+        self._excel.failed.connect(self.on_excelFailed)
+        self._images.finished.connect(self.on_imagesFinished)
+        self._images.failed.connect(self.on_imagesFailed)
         self._domain.harmonicMeasured.connect(self.on_harmonicMeasured)
         self._domain.singleMeasured.connect(self.on_singleMeasured)
+        self._domain.singleFinished.connect(self.on_singleFinished)
+        self._ui.statPlot.traceFlushed.connect(self.on_plotFlushed)
+        self._ui.waterfall.flushed.connect(self.on_plotFlushed)
 
     def _setupControls(self):
         pass
@@ -64,41 +81,100 @@ class MainWindow(QMainWindow):
 
     def _modeFindInstr(self):
         self._ui.btnMeasure.setEnabled(False)
+        self._ui.btnPause.setEnabled(False)
+        self._ui.btnAbort.setEnabled(False)
         self._ui.btnMeasureSingle.setEnabled(False)
+        self._ui.btnRemeasureSingle.setEnabled(False)
         self._ui.spinCutoffMagnitude.setEnabled(True)
         self._ui.harmonicMeasure.btnMeasure.setEnabled(False)
 
     def _modeMeasureReady(self):
         self._ui.btnMeasure.setEnabled(True)
+        self._ui.btnPause.setEnabled(False)
+        self._ui.btnAbort.setEnabled(False)
         self._ui.btnMeasureSingle.setEnabled(True)
+        self._ui.btnRemeasureSingle.setEnabled(True)
         self._ui.spinCutoffMagnitude.setEnabled(True)
         self._ui.harmonicMeasure.btnMeasure.setEnabled(False)
 
     def _modeMeasureRunning(self):
+        self._ui.btnFindInstr.setEnabled(False)
         self._ui.btnMeasure.setEnabled(False)
+        self._ui.btnPause.setEnabled(True)
+        self._ui.btnAbort.setEnabled(True)
         self._ui.btnMeasureSingle.setEnabled(False)
+        self._ui.btnRemeasureSingle.setEnabled(False)
         self._ui.spinCutoffMagnitude.setEnabled(False)
         self._ui.harmonicMeasure.btnMeasure.setEnabled(False)
 
     def _modeMeasureFinished(self):
+        self._ui.btnFindInstr.setEnabled(True)
         self._ui.btnMeasure.setEnabled(True)
+        self._ui.btnPause.setChecked(False)
+        self._ui.btnPause.setEnabled(False)
+        self._ui.btnAbort.setEnabled(False)
         self._ui.btnMeasureSingle.setEnabled(True)
+        self._ui.btnRemeasureSingle.setEnabled(True)
         self._ui.spinCutoffMagnitude.setEnabled(True)
         self._ui.harmonicMeasure.btnMeasure.setEnabled(True)
 
+    def _modeTaskRunning(self, stoppable=False, controllable=False):
+        # single and harmonic runs share the analyzer and the programmer with everything else,
+        # only the stop button of a continuous single measurement stays available,
+        # the harmonic pass can be paused and aborted like a sweep
+        self._ui.btnFindInstr.setEnabled(False)
+        self._ui.btnMeasure.setEnabled(False)
+        self._ui.btnPause.setEnabled(controllable)
+        self._ui.btnAbort.setEnabled(controllable)
+        self._ui.btnMeasureSingle.setEnabled(stoppable)
+        self._ui.btnRemeasureSingle.setEnabled(False)
+        self._ui.checkContinuous.setEnabled(False)
+        self._ui.harmonicMeasure.btnMeasure.setEnabled(False)
+
+    def _modeTaskFinished(self):
+        self._ui.btnFindInstr.setEnabled(True)
+        self._ui.btnMeasure.setEnabled(True)
+        self._ui.btnPause.setChecked(False)
+        self._ui.btnPause.setEnabled(False)
+        self._ui.btnAbort.setEnabled(False)
+        self._ui.btnMeasureSingle.setEnabled(True)
+        self._ui.btnRemeasureSingle.setEnabled(True)
+        self._ui.checkContinuous.setEnabled(True)
+        # harmonics need a base sweep
+        self._ui.harmonicMeasure.btnMeasure.setEnabled(bool(len(self._domain.amps)))
+
     # event handlers
     def resizeEvent(self, event):
         self._refreshView()
 
+    def closeEvent(self, event):
+        self._images.shutdown()
+        self._domain.closeSession()
+        super().closeEvent(event)
+
     def on_statsReady(self):
         self._modeMeasureFinished()
         self._ui.statPlot.plotStats()
+        self._ui.waterfall.plotStats()
 
     def on_codeMeasured(self):
+        # the plots only take the data here and redraw on their timers, the drawing is timed in on_plotFlushed
+        self._plotCode = self._domain.lastStoredCode
         self._ui.statPlot.plotCode()
+        self._ui.waterfall.plotCode()
+
+    def on_plotFlushed(self, seconds):
+        self._domain.addPlotTime(seconds, self._plotCode)
+
+    def on_statsUpdated(self):
+        self._ui.statPlot.plotStatsLive()
+        self._ui.waterfall.plotStats()
+
+    def on_measurementAborted(self, reason):
+        QMessageBox.information(self, 'Измерение прервано', reason)
 
     def on_harmonicMeasured(self):
-        self._ui.harmonicMeasure.btnMeasure.setEnabled(True)
+        self._modeTaskFinished()
         try:
             self._ui.harmonicMeasure.plot()
         except Exception as ex:
@@ -106,6 +182,13 @@ class MainWindow(QMainWindow):
 
     def on_singleMeasured(self):
         self._ui.singleMeasure.plot()
+        self._domain.ackSingle()
+        if self._domain.singleCached:
+            self._ui.statusbar.showMessage(f'Код {self._domain.code}: результат из памяти', 5000)
+
+    def on_singleFinished(self):
+        self._ui.btnMeasureSingle.setText('Измерить')
+        self._modeTaskFinished()
 
     @pyqtSlot(str)
     def on_editAnalyzerAddr_textChanged(self, text):
@@ -136,24 +219,54 @@ class MainWindow(QMainWindow):
     @pyqtSlot()
     def on_btnMeasure_clicked(self):
         if self._domain.canMeasure:
+            if not self._domain.measure():
+                return
             self._ui.statPlot.clear()
+            self._ui.waterfall.clear()
             self._modeMeasureRunning()
-            self._domain.measure()
+
+    @pyqtSlot(bool)
+    def on_btnPause_toggled(self, state):
+        if state:
+            self._domain.pause()
+        else:
+            self._domain.resume()
+
+    @pyqtSlot()
+    def on_btnAbort_clicked(self):
+        self._domain.abort()
 
     @pyqtSlot()
     def on_btnMeasureSingle_clicked(self):
-        self._domain.measureSingle()
+        if self._domain.singleRunning:
+            self._domain.stopSingle()
+            return
+
+        self._startSingle(force=False)
+
+    @pyqtSlot()
+    def on_btnRemeasureSingle_clicked(self):
+        self._startSingle(force=True)
+
+    def _startSingle(self, force):
+        continuous = self._ui.checkContinuous.isChecked()
+        self._modeTaskRunning(stoppable=continuous)
+        if continuous:
+            self._ui.btnMeasureSingle.setText('Стоп')
+        if not self._domain.measureSingle(continuous=continuous, force=force):
+            self.on_singleFinished()
 
     @pyqtSlot()
     def on_btnMeasureHarmonic_clicked(self):
-        if not self._domain.amps:
+        if not len(self._domain.amps):
             QMessageBox.information(self, 'Внимание',
                                     'Сперва необходимо провести стандартное измерение.')
             return
 
+        if not self._domain.measureHarmonics():
+            return
         self._ui.harmonicMeasure.clear()
-        self._domain.measureHarmonics()
-        self._ui.harmonicMeasure.btnMeasure.setEnabled(False)
+        self._modeTaskRunning(controllable=True)
 
     @pyqtSlot(int)
     def on_spinCode_valueChanged(self, value):
@@ -169,11 +282,15 @@ class MainWindow(QMainWindow):
 
     @pyqtSlot()
     def on_btnExportPng_clicked(self):
-        print('saving images')
-        path = ".\\image\\"
-        self._ui.statPlot.save(path)
-        subprocess.call(f'explorer {path}', shell=True)
+        self._images.export(self._domain)
+
+    def on_imagesFinished(self, path):
         print('done')
+        self._ui.statusbar.showMessage(f'Изображения сохранены: {path}', 5000)
+        subprocess.call(f'explorer {path}', shell=True)
+
+    def on_imagesFailed(self, error):
+        self._ui.statusbar.showMessage(f'Ошибка сохранения изображений: {error}', 5000)
 
     @pyqtSlot(str)
     def on_editSpiPinAddr_textChanged(self, value: str):
@@ -181,151 +298,24 @@ class MainWindow(QMainWindow):
             return
         self._domain.setSpiPinAddress(value)
 
+    @pyqtSlot(str)
+    def on_editBoardId_textChanged(self, value: str):
+        self._domain.boardId = value.strip()
+
     @pyqtSlot()
     def on_btnExportExcel_clicked(self):
-        print('export to excel')
-        to_export = [('частота_среза.xlsx', 'Код', 'Частота среза', self._domain.cutoffXs, self._domain.cutoffYs),
-                     ('дельта_частоты.xlsx', 'Код', 'Дельта', self._domain.deltaXs, self._domain.deltaYs),
-                     ('затухание_x2.xlsx', 'Код', 'Затухание при x2 частоте', self._domain.lossDoubleXs, self._domain.lossDoubleYs),
-                     ('затухание_x3.xlsx', 'Код', 'Затухание при x3 частоте', self._domain.lossTripleXs, self._domain.lossTripleYs)]
-
-        try:
-            for ex in to_export:
-                self.export_to_excel(ex)
-
-            self.export_to_excel_double_data(
-                ('подавление_гармоник.xlsx', 'Код', 'Подавление x2', 'Подавление х3', self._domain.codes, self._domain.harm_deltas[2], self._domain.harm_deltas[3])
-            )
-
-        except Exception as ex:
-            print(ex)
-        subprocess.call('explorer ' + '.\\excel\\', shell=True)
+        self._excel.export(self._domain)
 
     @pyqtSlot()
     def on_btnExportSingle_clicked(self):
-        data = ('ачх_от_кода.xlsx', 'Частота', 'Амплитуда', 'Код', self._domain.singleMeasureXs, self._domain.singleMeasureYs, self._domain.code)
+        self._excel.exportSingle(self._domain)
 
-        self.export_to_excel_single_measure(data)
+    def on_excelProgress(self, done, total):
+        self._ui.statusbar.showMessage(f'Экспорт в Excel: {done * 100 // total}%')
 
+    def on_excelFinished(self, path):
+        self._ui.statusbar.showMessage(f'Экспорт в Excel: {path}', 5000)
         subprocess.call('explorer ' + '.\\excel\\', shell=True)
 
-    def export_to_excel(self, data):
-        fname, xname, yname, xdata, ydata = data
-
-        excel_path = ".\\excel\\"
-        try:
-            os.makedirs(excel_path)
-        except OSError as ex:
-            if ex.errno != errno.EEXIST:
-                raise
-
-        wb = xlsxwriter.Workbook(excel_path + fname)
-        ws = wb.add_worksheet("Sheet1")
-
-        ws.write("A1", xname)
-        ws.write("B1", yname)
-
-        start_row = 0
-        row = 0
-        for x, y in zip(xdata, ydata):
-            row += 1
-            ws.write(start_row + row, 0, x)
-            ws.write(start_row + row, 1, y)
-
-        chart = wb.add_chart({"type": "scatter",
-                              "subtype": "smooth"})
-        chart.add_series({"name": "Sheet1!$B$1",
-                          "categories": "=Sheet1!$A$2:$A$" + str(row + 1),
-                          "values": "=Sheet1!$B$2:$B$" + str(row + 1)})
-        chart.set_x_axis({"name": xname})
-        chart.set_y_axis({"name": yname})
-        ws.insert_chart("D3", chart)
-
-        wb.close()
-
-    def export_to_excel_double_data(self, data):
-        fname, xname, yname1, yname2, xdata, ydata1, ydata2 = data
-
-        excel_path = ".\\excel\\"
-        try:
-            os.makedirs(excel_path)
-        except OSError as ex:
-            if ex.errno != errno.EEXIST:
-                raise
-
-        wb = xlsxwriter.Workbook(excel_path + fname)
-        ws = wb.add_worksheet("Sheet1")
-
-        ws.write("A1", xname)
-        ws.write("B1", yname1)
-        ws.write("C1", yname2)
-
-        start_row = 0
-        row = 0
-        for x, y1, y2 in zip(xdata, ydata1, ydata2):
-            row += 1
-            ws.write(start_row + row, 0, x)
-            ws.write(start_row + row, 1, y1)
-            ws.write(start_row + row, 2, y2)
-
-        chart = wb.add_chart({
-            "type": "scatter",
-            "subtype": "smooth"
-        })
-        chart.add_series({
-            "name": "Sheet1!$B$1",
-            "categories": "=Sheet1!$A$2:$A$" + str(row + 1),
-            "values": "=Sheet1!$B$2:$B$" + str(row + 1)
-        })
-        chart.add_series({
-            "name": "Sheet1!$C$1",
-            "categories": "=Sheet1!$A$2:$A$" + str(row + 1),
-            "values": "=Sheet1!$C$2:$C$" + str(row + 1)
-        })
-        chart.set_x_axis({"name": xname})
-        chart.set_y_axis({"name": 'Подавление гармоник'})
-        ws.insert_chart("F3", chart)
-
-        wb.close()
-
-    def export_to_excel_single_measure(self, data):
-        fname, xname, yname, codename, xdata, ydata, code = data
-
-        excel_path = ".\\excel\\"
-        try:
-            os.makedirs(excel_path)
-        except OSError as ex:
-            if ex.errno != errno.EEXIST:
-                raise
-
-        wb = xlsxwriter.Workbook(excel_path + fname)
-        ws = wb.add_worksheet("Sheet1")
-
-        ws.write("A1", xname)
-        ws.write("B1", yname)
-        ws.write("C1", codename)
-        ws.write("C2", code)
-
-        start_row = 0
-        row = 0
-        for x, y in zip(xdata, ydata):
-            row += 1
-            ws.write(start_row + row, 0, x)
-            ws.write(start_row + row, 1, y)
-
-        chart = wb.add_chart({
-            "type": "scatter",
-            "subtype": "smooth"
-        })
-        chart.add_series({
-            "name": "Sheet1!$B$1",
-            "categories": "=Sheet1!$A$2:$A$" + str(row + 1),
-            "values": "=Sheet1!$B$2:$B$" + str(row + 1)
-        })
-
-        chart.set_x_axis({"name": xname})
-        chart.set_y_axis({"name": "АЧХ"})
-        ws.insert_chart("F3", chart)
-
-        wb.close()
-
+    def on_excelFailed(self, error):
+        self._ui.statusbar.showMessage(f'Ошибка экспорта в Excel: {error}', 5000)
@@ -1,10 +1,18 @@
 import sys
+import logging
+import multiprocessing
 
 from PyQt5.QtWidgets import QApplication
 from mainwindow import MainWindow
 
 
 def main(args):
+    # image export renders in worker processes, frozen builds need this before anything else
+    multiprocessing.freeze_support()
+
+    # per-code measurement messages are logged at DEBUG
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(name)s: %(message)s')
+
     app = QApplication(sys.argv)
 
     window = MainWindow()
@@ -0,0 +1,161 @@
+import argparse
+import csv
+import logging
+import os
+import sys
+import time
+
+import numpy as np
+
+from PyQt5.QtCore import QCoreApplication
+
+import failrules
+
+from domain import Domain, InstrumentManager
+from excelexport import snapshot, write_workbook
+from sweepstore import SweepStore, safe_name
+
+EXIT_OK = 0
+EXIT_FAILED = 1
+EXIT_USAGE = 2
+EXIT_NO_INSTRUMENTS = 3
+EXIT_ERROR = 4
+
+
+def parse_args(args):
+    parser = argparse.ArgumentParser(description='Headless LPF board measurement: discovery, sweep, harmonics.')
+    parser.add_argument('boards', nargs='*', help='board serial numbers, measured in order')
+    parser.add_argument('--board-file', help='text file with one board serial number per line')
+    parser.add_argument('--analyzer', help='analyzer VISA address, e.g. TCPIP::192.168.0.3::INSTR')
+    parser.add_argument('--cutoff', type=float, default=-6, help='cutoff level, dB (default: -6)')
+    parser.add_argument('--protocol', choices=['parallel', 'serial'], help='programmer protocol')
+    parser.add_argument('--address', type=int, default=0, help='SPI pin address')
+    parser.add_argument('--points', type=int, help='analyzer sweep points (default: keep the analyzer setting)')
+    parser.add_argument('--storage', choices=['float64', 'float32', 'db16'], default='float64',
+                        help='trace storage: float64, float32 or 0.01 dB quantized int16 (default: float64)')
+    parser.add_argument('--adaptive', action='store_true', help='adaptive code sampling instead of a full sweep')
+    parser.add_argument('--no-harmonics', action='store_true', help='skip the harmonic measurement')
+    parser.add_argument('--cutoff-window', nargs=2, type=float, metavar=('LOW', 'HIGH'),
+                        help='fail the board as soon as a cutoff falls outside LOW..HIGH Hz')
+    parser.add_argument('--monotonic', action='store_true', help='fail the board on non-monotonic cutoff vs code')
+    parser.add_argument('--prompt', action='store_true', help='wait for Enter before each board')
+    parser.add_argument('--out', default='results', help='output directory (default: results)')
+    parser.add_argument('--store', default='store', help='sweep store directory (default: store)')
+    parser.add_argument('-v', '--verbose', action='store_true', help='log every measured code')
+    parser.add_argument('--excel', action='store_true', help='also write <out>/<board>.xlsx')
+    parser.add_argument('--mock', action='store_true', help='simulated programmer and analyzer instead of the hardware')
+    return parser.parse_args(args)
+
+
+def read_boards(args):
+    boards = list(args.boards)
+    if args.board_file:
+        with open(args.board_file, mode='rt', encoding='utf-8') as f:
+            boards += [line.strip() for line in f if line.strip()]
+    return boards
+
+
+def setup_domain(domain, args):
+    if args.analyzer:
+        domain.analyzerAddress = args.analyzer
+    domain.cutoffMag = args.cutoff
+    domain.store = SweepStore(args.store)
+    domain.setSpiPinAddress(str(args.address))
+    if args.points:
+        domain.sweepPoints = args.points
+    domain.traceStorage = args.storage
+    if args.adaptive:
+        domain.sweepMode = 'adaptive'
+
+    if args.cutoff_window:
+        domain.failRules.append(failrules.cutoff_window(*args.cutoff_window))
+    if args.monotonic:
+        domain.failRules.append(failrules.monotonic_cutoff())
+
+
+def write_board(domain, path):
+    # every column in code order: the cutoff display series is reversed, it is turned back here
+    stats = domain.stats
+    cutoffs = stats.cutoff_freqs[::-1]
+    deltas = list(np.abs(np.diff(cutoffs))) + ['']
+    harm_x2 = domain.harm_deltas.get(2, [])
+    harm_x3 = domain.harm_deltas.get(3, [])
+    with open(path, mode='wt', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['code', 'cutoff', 'delta', 'loss_x2', 'loss_x3', 'harm_x2', 'harm_x3', 'interpolated'])
+        for code, row in enumerate(zip(cutoffs, deltas, stats.loss_double_freq, stats.loss_triple_freq,
+                                       stats.interpolated)):
+            cutoff, delta, loss2, loss3, interpolated = row
+            h2 = harm_x2[code] if code < len(harm_x2) else ''
+            h3 = harm_x3[code] if code < len(harm_x3) else ''
+            writer.writerow([code, cutoff, delta, loss2, loss3, h2, h3, int(interpolated)])
+
+
+def measure_board(domain, board, args):
+    domain.boardId = board
+    domain.measure(wait=True)
+    if not domain.abortReason and not args.no_harmonics:
+        domain.measureHarmonics(wait=True)
+
+    name = safe_name(board) or 'noname'
+    write_board(domain, os.path.join(args.out, f'{name}.csv'))
+    if args.excel:
+        write_workbook(os.path.join(args.out, f'{name}.xlsx'), snapshot(domain))
+    return domain.abortReason
+
+
+def main(args):
+    args = parse_args(args[1:])
+    boards = read_boards(args)
+    if not boards:
+        print('no boards to measure: give board serial numbers or --board-file', file=sys.stderr)
+        return EXIT_USAGE
+
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.INFO,
+                        format='%(asctime)s %(name)s: %(message)s')
+
+    app = QCoreApplication(sys.argv)
+
+    domain = Domain(instruments=InstrumentManager(mock=args.mock))
+    setup_domain(domain, args)
+    if not domain.findInstruments():
+        print('instruments not found')
+        return EXIT_NO_INSTRUMENTS
+    if args.protocol:
+        domain.setSpiProtocol(parallel=args.protocol == 'parallel')
+
+    os.makedirs(args.out, exist_ok=True)
+
+    failed = 0
+    errors = 0
+    with open(os.path.join(args.out, 'summary.csv'), mode='at', encoding='utf-8', newline='') as f:
+        summary = csv.writer(f)
+        for board in boards:
+            if args.prompt:
+                input(f'insert board {board} and press Enter...')
+
+            # an instrument error ends this board only, the rest of the list is still measured
+            start = time.perf_counter()
+            try:
+                reason = measure_board(domain, board, args)
+                status = 'FAIL' if reason else 'PASS'
+                failed += bool(reason)
+            except Exception as ex:
+                logging.exception('board %s: measurement error', board)
+                reason = f'error: {ex}'
+                status = 'ERROR'
+                errors += 1
+            elapsed = time.perf_counter() - start
+            summary.writerow([time.strftime('%Y-%m-%d %H:%M:%S'), board, status, reason, f'{elapsed:.1f}'])
+            f.flush()
+            print(f'board {board}: {status} {reason} ({elapsed:.1f} s)')
+
+    domain.closeSession()
+    print(f'done: {len(boards) - failed - errors} passed, {failed} failed, {errors} errors')
+    if errors:
+        return EXIT_ERROR
+    return EXIT_FAILED if failed else EXIT_OK
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
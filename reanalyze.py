@@ -0,0 +1,170 @@
+import argparse
+import csv
+import multiprocessing
+import os
+import sys
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from cutoffstats import cutoff_stats
+from sweepstore import SweepStore
+
+EXIT_OK = 0
+EXIT_FAILED = 1
+EXIT_NO_SWEEPS = 3
+
+columns = ['board', 'timestamp', 'path', 'cutoff_mag', 'codes', 'cutoff_min', 'cutoff_max', 'delta_max',
+           'loss_x2_min', 'loss_x3_min', 'harm_x2_min', 'harm_x3_min', 'status', 'reason']
+
+
+def parse_args(args):
+    parser = argparse.ArgumentParser(description='Recompute LPF statistics of stored sweeps at other cutoff levels.')
+    parser.add_argument('--store', default='store', help='sweep store directory (default: store)')
+    parser.add_argument('--board', nargs='+', help='only these boards (default: all)')
+    parser.add_argument('--since', help='only sweeps from this date on, e.g. 2024-05-13')
+    parser.add_argument('--until', help='only sweeps before this date, e.g. 2024-05-20')
+    parser.add_argument('--cutoff', type=float, nargs='+', default=[-6], help='cutoff levels, dB (default: -6)')
+    parser.add_argument('--cutoff-window', nargs=2, type=float, metavar=('LOW', 'HIGH'),
+                        help='fail sweeps with a cutoff outside LOW..HIGH Hz')
+    parser.add_argument('--max-delta', type=float, help='fail sweeps with a cutoff step between codes above this, Hz')
+    parser.add_argument('--workers', type=int, help='worker processes (default: CPU count)')
+    parser.add_argument('--out', default='reanalysis.csv', help='summary table (default: reanalysis.csv)')
+    return parser.parse_args(args)
+
+
+def select_sweeps(store, args):
+    entries = store.list()
+    if args.board:
+        entries = [e for e in entries if e.get('board') in args.board]
+    if args.since:
+        entries = [e for e in entries if e.get('timestamp', '') >= args.since]
+    if args.until:
+        entries = [e for e in entries if e.get('timestamp', '') < args.until]
+    return entries
+
+
+def _harmonic_min(sweep, codes, amp_max, n):
+    if f'harm{n}' not in sweep:
+        return np.nan
+    harms = sweep.harmonic(n)
+    codes = codes[codes < len(harms)]
+    if not len(codes):
+        return np.nan
+    return float(np.nanmin(amp_max[:len(codes)] - np.nanmax(harms[codes], axis=1)))
+
+
+def analyze_sweep(root, path, levels, cutoff_window=None, max_delta=None):
+    # runs in a worker process: the traces are memory-mapped there, only the summary rows come back
+    sweep = SweepStore(root).load(path)
+    codes = np.flatnonzero(sweep['filled'])
+    base = {'board': sweep.board, 'timestamp': sweep.meta.get('timestamp', ''), 'path': path}
+    if not len(codes):
+        return [dict(base, cutoff_mag=level, codes=0, status='FAIL', reason='no measured codes') for level in levels]
+
+    freqs = sweep['freqs']
+    axis = freqs if freqs.ndim == 1 else np.asarray(freqs[codes])
+    amps = np.asarray(sweep.amps[codes], dtype=np.float64)
+    amp_max = amps.max(axis=1)
+
+    # harmonic suppression does not depend on the cutoff level
+    harm_x2 = _harmonic_min(sweep, codes, amp_max, 2)
+    harm_x3 = _harmonic_min(sweep, codes, amp_max, 3)
+
+    rows = list()
+    for level in levels:
+        stats = cutoff_stats(axis, amps, level)
+        # adaptive sweeps skip codes, the steps are taken between neighbouring codes
+        # after interpolating over the skipped ones, as the live delta plot does
+        steps = np.arange(codes[0], codes[-1] + 1)
+        deltas = np.abs(np.diff(np.interp(steps, codes, stats.cutoff_freqs)))
+
+        reasons = list()
+        if cutoff_window:
+            low, high = cutoff_window
+            outside = codes[(stats.cutoff_freqs < low) | (stats.cutoff_freqs > high)]
+            if len(outside):
+                reasons.append(f'cutoff outside {low:.3e}..{high:.3e} Hz at code {outside[0]}')
+        if max_delta is not None and len(deltas) and deltas.max() > max_delta:
+            reasons.append(f'cutoff step {deltas.max():.3e} Hz at code {steps[deltas.argmax() + 1]}')
+
+        rows.append(dict(
+            base,
+            cutoff_mag=level,
+            codes=len(codes),
+            cutoff_min=float(stats.cutoff_freqs.min()),
+            cutoff_max=float(stats.cutoff_freqs.max()),
+            delta_max=float(deltas.max()) if len(deltas) else np.nan,
+            loss_x2_min=float(np.nanmin(stats.loss_double)),
+            loss_x3_min=float(np.nanmin(stats.loss_triple)),
+            harm_x2_min=harm_x2,
+            harm_x3_min=harm_x3,
+            status='FAIL' if reasons else 'PASS',
+            reason='; '.join(reasons),
+        ))
+    return rows
+
+
+def reanalyze(root, entries, levels, cutoff_window=None, max_delta=None, workers=None):
+    rows = list()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(analyze_sweep, root, e['path'], levels, cutoff_window, max_delta): e for e in entries}
+        for future in as_completed(futures):
+            try:
+                rows += future.result()
+            except Exception as ex:
+                entry = futures[future]
+                rows += [{'board': entry.get('board', ''), 'timestamp': entry.get('timestamp', ''),
+                          'path': entry['path'], 'cutoff_mag': level, 'status': 'FAIL', 'reason': f'error: {ex}'}
+                         for level in levels]
+    return sorted(rows, key=lambda r: (r['board'], r['timestamp'], r['path'], levels.index(r['cutoff_mag'])))
+
+
+def write_summary(rows, path):
+    with open(path, mode='wt', encoding='utf-8', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=columns)
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def print_summary(rows):
+    print(f'{"board":<12} {"timestamp":<19} {"level":>6} {"codes":>5} {"cutoff min":>11} {"cutoff max":>11} '
+          f'{"max dF":>10} {"x2 loss":>8} {"x3 loss":>8}  status')
+    for r in rows:
+        if 'codes' not in r or not r['codes']:
+            print(f'{r["board"]:<12} {r["timestamp"]:<19} {r["cutoff_mag"]:>6} {"":>5} {"":>11} {"":>11} {"":>10} '
+                  f'{"":>8} {"":>8}  {r["status"]} {r["reason"]}')
+            continue
+        print(f'{r["board"]:<12} {r["timestamp"]:<19} {r["cutoff_mag"]:>6} {r["codes"]:>5} {r["cutoff_min"]:>11.4e} '
+              f'{r["cutoff_max"]:>11.4e} {r["delta_max"]:>10.3e} {r["loss_x2_min"]:>8.2f} {r["loss_x3_min"]:>8.2f}  '
+              f'{r["status"]} {r["reason"]}')
+
+
+def main(args):
+    args = parse_args(args[1:])
+    store = SweepStore(args.store)
+    entries = list()
+    for entry in select_sweeps(store, args):
+        # index paths are relative to the store root
+        if os.path.isdir(store.resolve(entry['path'])):
+            entries.append(entry)
+        else:
+            print(f'warning: sweep {entry["path"]} of board {entry.get("board", "")} is missing, skipped',
+                  file=sys.stderr)
+    if not entries:
+        print('no stored sweeps match')
+        return EXIT_NO_SWEEPS
+
+    rows = reanalyze(store.root, entries, args.cutoff, args.cutoff_window, args.max_delta, args.workers)
+    write_summary(rows, args.out)
+    print_summary(rows)
+
+    failed = sum(r['status'] == 'FAIL' for r in rows)
+    print(f'done: {len(entries)} sweeps x {len(args.cutoff)} levels, {len(rows) - failed} passed, {failed} failed')
+    return EXIT_FAILED if failed else EXIT_OK
+
+
+if __name__ == '__main__':
+    multiprocessing.freeze_support()
+    sys.exit(main(sys.argv))
@@ -0,0 +1,172 @@
+import json
+import logging
+import itertools
+import os
+import threading
+import time
+
+from collections import defaultdict, deque
+from contextlib import contextmanager
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# per-code stages, in pipeline order
+stages = ('program', 'sweep', 'transfer', 'parse', 'stats', 'plot')
+percentiles = (50, 90, 99)
+
+
+class StageTimer:
+    # per-code stage timings of the running sweep: codes collect their stages while in flight
+    # (the pipelined sweep has two codes in flight), finished codes go to a ring buffer and the listeners;
+    # stages recorded without a code (drain, batch stats, persist) count for the whole run
+
+    def __init__(self, capacity=4096, log_path=None, log_max_bytes=4 * 1024 * 1024):
+        self.log_path = log_path
+        self.log_max_bytes = log_max_bytes
+        self.listeners = list()
+
+        self._lock = threading.Lock()
+        self._records = deque(maxlen=capacity)
+        self._pending = dict()
+        self._run = defaultdict(float)
+        self._active = False
+        self._runs = itertools.count(1)
+        self._name = ''
+        self._kind = ''
+        self._board = ''
+        self._started = 0.0
+
+    def begin(self, kind, board=''):
+        with self._lock:
+            self._pending.clear()
+            self._run.clear()
+            self._name = f'{time.strftime("%Y%m%d-%H%M%S")}-{kind}-{next(self._runs)}'
+            self._kind = kind
+            self._board = board
+            self._started = time.perf_counter()
+            self._active = True
+
+    def add(self, stage, seconds, code=None):
+        if not self._active:
+            return
+        with self._lock:
+            if code is None:
+                self._run[stage] += seconds
+                return
+            record = self._pending.get(code)
+            if record is None:
+                record = self._pending[code] = {'run': self._name, 'code': int(code)}
+            record[stage] = record.get(stage, 0.0) + seconds
+
+    def time(self, stage, code, fn, *args, **kwargs):
+        if not self._active:
+            return fn(*args, **kwargs)
+        start = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            self.add(stage, time.perf_counter() - start, code)
+
+    @contextmanager
+    def stage(self, stage, code=None):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(stage, time.perf_counter() - start, code)
+
+    def finish(self, code):
+        with self._lock:
+            record = self._pending.pop(code, None)
+            if record is None:
+                return
+            self._records.append(record)
+        for listener in self.listeners:
+            listener(record)
+
+    def annotate(self, stage, seconds, code=None):
+        # stages reported after the code is finished (GUI plotting) go to that code's record of the current run,
+        # or to the newest record when no code is given
+        with self._lock:
+            record = self._pending.get(code)
+            if record is None:
+                record = next((r for r in reversed(self._records)
+                               if code is None or (r['run'] == self._name and r['code'] == code)), None)
+            if record is not None:
+                record[stage] = record.get(stage, 0.0) + seconds
+
+    def end(self):
+        if not self._active:
+            return dict()
+        for code in list(self._pending):
+            self.finish(code)
+        self._run['total'] = time.perf_counter() - self._started
+        self._active = False
+
+        summary = self.summary()
+        self._write_log(summary)
+        return summary
+
+    def records(self, name=None):
+        name = self._name if name is None else name
+        with self._lock:
+            return [r for r in self._records if r['run'] == name]
+
+    def totals(self):
+        totals = defaultdict(float)
+        for record in self.records():
+            for stage in stages:
+                totals[stage] += record.get(stage, 0.0)
+        totals.update(self._run)
+        return dict(totals)
+
+    def summary(self):
+        records = self.records()
+        summary = {
+            'run': self._name,
+            'kind': self._kind,
+            'board': self._board,
+            'codes': len(records),
+            'run_stages': dict(self._run),
+            'stages': dict(),
+        }
+        for stage in stages:
+            values = np.array([r[stage] for r in records if stage in r])
+            if not len(values):
+                continue
+            summary['stages'][stage] = dict(
+                {'count': len(values), 'total': float(values.sum()), 'max': float(values.max())},
+                **{f'p{p}': float(v) for p, v in zip(percentiles, np.percentile(values, percentiles))})
+        return summary
+
+    def _write_log(self, summary):
+        if not self.log_path:
+            return
+        try:
+            self._rotate_log()
+            with open(self.log_path, mode='at', encoding='utf-8') as f:
+                for record in self.records():
+                    f.write(json.dumps(dict(record, type='code')) + '\n')
+                f.write(json.dumps(dict(summary, type='summary')) + '\n')
+        except OSError as ex:
+            logger.warning('error writing timing log: %s', ex)
+
+    def _rotate_log(self):
+        # every run appends to the log, past log_max_bytes it moves to <log>.1 and a new one is started,
+        # so at most two files of timings are kept
+        if not self.log_max_bytes or not os.path.exists(self.log_path):
+            return
+        if os.path.getsize(self.log_path) >= self.log_max_bytes:
+            os.replace(self.log_path, f'{self.log_path}.1')
+
+
+def format_summary(summary):
+    lines = [f'stage timings, {summary["codes"]} codes:']
+    for stage, values in summary['stages'].items():
+        ps = ', '.join(f'p{p} {values[f"p{p}"] * 1000:7.1f}' for p in percentiles)
+        lines.append(f'  {stage:>8}: {values["total"]:8.3f} s, {ps}, max {values["max"] * 1000:7.1f} ms')
+    for stage, elapsed in summary['run_stages'].items():
+        lines.append(f'  {stage:>8}: {elapsed:8.3f} s')
+    return '\n'.join(lines)
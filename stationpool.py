@@ -0,0 +1,241 @@
+import argparse
+import json
+import logging
+import os
+import sys
+import threading
+import time
+
+from PyQt5.QtCore import QObject, Qt, pyqtSignal, QCoreApplication
+
+from domain import Domain, InstrumentManager
+from measurebatch import write_board
+from sweepstore import SweepStore, safe_name
+
+
+class Station:
+
+    def __init__(self, name, analyzer_addr=None, protocol=None, address=0, cutoff=-6, mock=None):
+        self.name = name
+        self.protocol = protocol
+
+        instruments = InstrumentManager(cache_path=f'instruments_{name}.json', mock=mock)
+        self.domain = Domain(instruments=instruments)
+        self.domain.timingLog = f'timing_{name}.jsonl'
+        self.domain.store = SweepStore(root=os.path.join('store', safe_name(name) or 'noname'))
+        if analyzer_addr:
+            self.domain.analyzerAddress = analyzer_addr
+        self.domain.cutoffMag = cutoff
+        self.domain.setSpiPinAddress(str(address))
+
+        self.boards = list()
+        self.results = list()
+        self.current = ''
+        self.codes_done = 0
+        self.started = 0.0
+        self.finished = 0.0
+        self.error = ''
+
+        # the station worker has no event loop, count codes in the emitting thread
+        self.domain.codeMeasured.connect(self._on_codeMeasured, Qt.DirectConnection)
+
+    def _on_codeMeasured(self):
+        self.codes_done += 1
+
+    @property
+    def instruments(self):
+        return self.domain._instruments
+
+    @property
+    def failed(self):
+        return sum(1 for _, reason, _ in self.results if reason)
+
+    @property
+    def boards_per_hour(self):
+        elapsed = (self.finished or time.monotonic()) - self.started
+        return len(self.results) / elapsed * 3600 if self.started and elapsed > 0 else 0.0
+
+
+class StationPool(QObject):
+
+    progress = pyqtSignal()
+    boardFinished = pyqtSignal(str, str, str)
+    finished = pyqtSignal()
+
+    def __init__(self, out_path='results', harmonics=True, parent=None):
+        super().__init__(parent)
+
+        self._out_path = out_path
+        self._harmonics = harmonics
+
+        self._stations = list()
+        self._threads = list()
+        self._started = 0.0
+
+    def add_station(self, station):
+        self._stations.append(station)
+        return station
+
+    def find(self):
+        # discovery runs one station at a time, ports taken by one bench are hidden from the next
+        taken = set()
+        found = True
+        for station in self._stations:
+            station.instruments.excluded_ports = taken
+            if not station.domain.findInstruments():
+                station.error = 'instruments not found'
+                found = False
+                continue
+            if station.protocol:
+                station.domain.setSpiProtocol(parallel=station.protocol == 'parallel')
+            taken.add(station.instruments.programmer_port)
+        return found
+
+    def start(self):
+        self._started = time.monotonic()
+        self._threads = [threading.Thread(target=self._run_station, args=(station, ), daemon=True)
+                         for station in self._stations if not station.error]
+        for thread in self._threads:
+            thread.start()
+
+    def wait(self, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for thread in self._threads:
+            thread.join(None if deadline is None else max(deadline - time.monotonic(), 0))
+        return not self.running
+
+    def abort(self):
+        for station in self._stations:
+            station.boards.clear()
+            station.domain.abort('station pool aborted')
+
+    def _run_station(self, station):
+        out_path = os.path.join(self._out_path, station.name)
+        os.makedirs(out_path, exist_ok=True)
+
+        station.started = time.monotonic()
+        while True:
+            # abort() empties the queue from another thread
+            try:
+                board = station.boards.pop(0)
+            except IndexError:
+                break
+            station.current = board
+            station.codes_done = 0
+            self.progress.emit()
+
+            try:
+                station.domain.boardId = board
+                station.domain.measure(wait=True)
+                if not station.domain.abortReason and self._harmonics:
+                    station.domain.measureHarmonics(wait=True)
+                write_board(station.domain, os.path.join(out_path, f'{safe_name(board) or "noname"}.csv'))
+                reason = station.domain.abortReason
+            except Exception as ex:
+                reason = f'error: {ex}'
+
+            station.results.append((board, reason, time.monotonic()))
+            self.boardFinished.emit(station.name, board, reason)
+
+        station.domain.closeSession()
+        station.current = ''
+        station.finished = time.monotonic()
+        self.progress.emit()
+        if not self.running:
+            self.finished.emit()
+
+    @property
+    def running(self):
+        return any(thread.is_alive() for thread in self._threads)
+
+    @property
+    def stations(self):
+        return self._stations
+
+    def summary(self):
+        elapsed = time.monotonic() - self._started if self._started else 0.0
+        done = sum(len(s.results) for s in self._stations)
+        return {
+            'elapsed': elapsed,
+            'boards': done,
+            'failed': sum(s.failed for s in self._stations),
+            'boards_per_hour': done / elapsed * 3600 if elapsed > 0 else 0.0,
+            'stations': [{
+                'name': s.name,
+                'current': s.current,
+                'codes': s.codes_done,
+                'done': len(s.results),
+                'queued': len(s.boards),
+                'failed': s.failed,
+                'boards_per_hour': s.boards_per_hour,
+                'error': s.error,
+            } for s in self._stations]
+        }
+
+    def dashboard(self):
+        summary = self.summary()
+        lines = [f'{"station":>12} {"board":>12} {"codes":>6} {"done":>5} {"queue":>5} {"fail":>5} {"b/h":>7}']
+        for s in summary['stations']:
+            lines.append(f'{s["name"]:>12} {s["current"] or s["error"] or "-":>12} {s["codes"]:>6} {s["done"]:>5} '
+                         f'{s["queued"]:>5} {s["failed"]:>5} {s["boards_per_hour"]:>7.1f}')
+        lines.append(f'total: {summary["boards"]} boards, {summary["failed"]} failed, '
+                     f'{summary["boards_per_hour"]:.1f} boards/hour, {summary["elapsed"]:.0f} s')
+        return '\n'.join(lines)
+
+
+def parse_args(args):
+    parser = argparse.ArgumentParser(description='Run several programmer+analyzer stations in one process.')
+    parser.add_argument('config', nargs='?',
+                        help='JSON list of stations: {"name", "analyzer", "protocol", "address", "boards": [...]}')
+    parser.add_argument('--mock', type=int, default=0, metavar='N', help='run N mock stations instead of a config')
+    parser.add_argument('--boards', type=int, default=3, help='boards per mock station (default: 3)')
+    parser.add_argument('--cutoff', type=float, default=-6, help='cutoff level, dB (default: -6)')
+    parser.add_argument('--no-harmonics', action='store_true', help='skip the harmonic measurement')
+    parser.add_argument('--out', default='results', help='output directory (default: results)')
+    parser.add_argument('--refresh', type=float, default=2.0, help='dashboard refresh period, s')
+    return parser.parse_args(args)
+
+
+def make_pool(args):
+    pool = StationPool(out_path=args.out, harmonics=not args.no_harmonics)
+    if args.mock:
+        for i in range(args.mock):
+            station = pool.add_station(Station(f'mock{i + 1}', cutoff=args.cutoff, mock=True))
+            station.boards = [f'{station.name}-{b + 1:03d}' for b in range(args.boards)]
+        return pool
+
+    with open(args.config, mode='rt', encoding='utf-8') as f:
+        config = json.load(f)
+    for entry in config:
+        station = pool.add_station(Station(entry['name'], analyzer_addr=entry.get('analyzer'),
+                                           protocol=entry.get('protocol'), address=entry.get('address', 0),
+                                           cutoff=args.cutoff, mock=False))
+        station.boards = list(entry.get('boards', []))
+    return pool
+
+
+def main(args):
+    args = parse_args(args[1:])
+    if not args.config and not args.mock:
+        print('either a station config or --mock N is required')
+        return 2
+
+    # the dashboard is the progress output, per-station messages only when something goes wrong
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s %(name)s: %(message)s')
+
+    app = QCoreApplication(sys.argv)
+
+    pool = make_pool(args)
+    if not pool.find():
+        print('some stations have no instruments, they are skipped')
+
+    pool.start()
+    while not pool.wait(args.refresh):
+        print(pool.dashboard())
+    print(pool.dashboard())
+
+    return 1 if pool.summary()['failed'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
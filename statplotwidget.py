@@ -1,20 +1,20 @@
-import errno
-import os
-
+from PyQt5.QtCore import QTimer
 from PyQt5.QtWidgets import QGridLayout, QWidget
 from mytools.plotwidget import PlotWidget
 
+from liveplotwidget import LivePlotWidget
+
 
 class StatPlotWidget(QWidget):
 
-    def __init__(self, parent=None, domain=None):
+    def __init__(self, parent=None, domain=None, fps=5):
         super().__init__(parent)
 
         self._domain = domain
 
         self._grid = QGridLayout()
 
-        self._plot11 = PlotWidget(parent=None, toolbar=True)
+        self._plot11 = LivePlotWidget(parent=None, toolbar=True)
         self._plot12 = PlotWidget(parent=None, toolbar=True)
         self._plot21 = PlotWidget(parent=None, toolbar=True)
         self._plot22 = PlotWidget(parent=None, toolbar=True)
@@ -26,9 +26,19 @@ class StatPlotWidget(QWidget):
 
         self.setLayout(self._grid)
 
+        # live stats arrive once per code, the three stat plots are rebuilt at most `fps` times per second
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.setInterval(1000 // fps)
+        self._timer.timeout.connect(self._flushStats)
+
         self._init()
 
     def _init(self):
+        self._init11()
+        self._initStats()
+
+    def _init11(self):
         # self._plot11.set_tight_layout(True)
         self._plot11.subplots_adjust(bottom=0.150)
         self._plot11.set_title('Коэффициент преобразования')
@@ -39,6 +49,7 @@ class StatPlotWidget(QWidget):
         self._plot11.grid(b=True, which='minor', color='0.7', linestyle='--')
         self._plot11.grid(b=True, which='major', color='0.5', linestyle='-')
 
+    def _initStats(self):
         # self._plot12.set_tight_layout(True)
         self._plot12.subplots_adjust(bottom=0.150)
         self._plot12.set_title(f'Частота среза по уровню {self._domain.cutoffMag} дБ')
@@ -64,34 +75,51 @@ class StatPlotWidget(QWidget):
         self._plot22.grid(b=True, which='major', color='0.5', linestyle='-')
 
     def clear(self):
+        self._timer.stop()
         self._plot11.clear()
         self._plot12.clear()
         self._plot21.clear()
         self._plot22.clear()
         self._init()
 
+    def _clearStats(self):
+        self._plot12.clear()
+        self._plot21.clear()
+        self._plot22.clear()
+        self._initStats()
+
+    def _plotStatCurves(self):
+        # one snapshot for all curves, the sweep may publish a newer one meanwhile
+        stats = self._domain.stats
+        self._plot12.plot(stats.codes, stats.cutoff_freqs, color='0.4')
+        interpolated = stats.interpolated[::-1]
+        if interpolated.any():
+            measured = ~interpolated
+            self._plot12.plot(stats.codes[measured], stats.cutoff_freqs[measured], 'o', color='0.2', markersize=3)
+        self._plot21.plot(stats.cutoff_freq_delta_x, stats.cutoff_freq_delta_y, color='0.4')
+        self._plot22.plot(stats.codes, stats.loss_double_freq, color='0.4')
+        self._plot22.plot(stats.codes, stats.loss_triple_freq, color='0.4')
+
+    def plotStatsLive(self):
+        if not self._timer.isActive():
+            self._timer.start()
+
+    def _flushStats(self):
+        self._clearStats()
+        self._plotStatCurves()
+
+    @property
+    def traceFlushed(self):
+        return self._plot11.flushed
+
     def plotCode(self):
-        print('plotting code')
-        self._plot11.plot(self._domain.lastXs, self._domain.lastYs, color='0.4')
+        self._plot11.setData(self._domain.lastXs, lambda: self._domain.amps)
 
     def plotStats(self):
         print('plotting stats')
-        self._plot12.plot(self._domain.cutoffXs, self._domain.cutoffYs, color='0.4')
-        self._plot21.plot(self._domain.deltaXs, self._domain.deltaYs, color='0.4')
-        self._plot22.plot(self._domain.lossDoubleXs, self._domain.lossDoubleYs, color='0.4')
-        self._plot22.plot(self._domain.lossTripleXs, self._domain.lossTripleYs, color='0.4')
+        self._timer.stop()
+        self._clearStats()
+        self._plotStatCurves()
 
         self._plot11.axhline(self._domain.cutoffAmp, 0, 1, linewidth=0.8, color='0.3', linestyle='--')
-        self._plot11.set_yticks(sorted(set(list(self._plot11.get_yticks()[0]) + [self._domain.cutoffMag])))
-
-    def save(self, img_path='./image'):
-        try:
-            os.makedirs(img_path)
-        except OSError as ex:
-            if ex.errno != errno.EEXIST:
-                raise IOError('Error creating image dir.')
-
-        for plot, name in zip([self._plot11, self._plot12, self._plot21, self._plot22], ['stats.png', 'cutoff.png', 'delta.png', 'double-triple.png']):
-            plot.savefig(img_path + name, dpi=400)
-
-
+        self._plot11.set_yticks(sorted(set(list(self._plot11.get_yticks()) + [self._domain.cutoffMag])))
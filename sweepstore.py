@@ -0,0 +1,157 @@
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+from tracematrix import decode
+
+logger = logging.getLogger(__name__)
+
+# index writers of every store in the process, station threads may share one root
+index_lock = threading.Lock()
+
+# characters Windows does not allow in file names, path separators among them, and its reserved device names
+forbidden_chars = re.compile(r'[<>:"/\\|?*\x00-\x1f]')
+reserved_names = {'CON', 'PRN', 'AUX', 'NUL'} | {f'{dev}{n}' for dev in ('COM', 'LPT') for n in range(1, 10)}
+
+# on-disk layout, one directory per sweep, one .npy file per column:
+#   <root>/index.jsonl               one metadata line per sweep, for listing without a directory walk
+#   <root>/<board>/<stamp>/meta.json
+#   <root>/<board>/<stamp>/<column>.npy
+# sweep paths in the index and meta are relative to the root, a store can be moved or read from anywhere
+
+
+def safe_name(name):
+    # board ids are typed by the operator and become directory and file names,
+    # they must stay a single path component inside the output directory
+    name = forbidden_chars.sub('_', name).strip().rstrip('. ')
+    if name.split('.')[0].upper() in reserved_names:
+        name = f'_{name}'
+    return name
+
+
+class StoredSweep:
+
+    def __init__(self, path, meta):
+        self.path = path
+        self.meta = meta
+        self._arrays = dict()
+
+    def __getitem__(self, name):
+        if name not in self._arrays:
+            self._arrays[name] = np.load(os.path.join(self.path, f'{name}.npy'), mmap_mode='r')
+        return self._arrays[name]
+
+    def __contains__(self, name):
+        return name in self.meta.get('columns', [])
+
+    @property
+    def board(self):
+        return self.meta.get('board', '')
+
+    @property
+    def freqs(self):
+        # sweeps with one shared frequency axis store it once
+        freqs = self['freqs']
+        if freqs.ndim == 1:
+            return np.broadcast_to(freqs, self['amps'].shape)
+        return freqs
+
+    @property
+    def amps(self):
+        return self._decoded('amps')
+
+    def harmonic(self, n):
+        return self._decoded(f'harm{n}')
+
+    def _decoded(self, name):
+        return decode(self[name], self.meta.get('trace_storage', 'float64'))
+
+
+class SweepStore:
+
+    def __init__(self, root='store'):
+        self._root = root
+
+    @property
+    def root(self):
+        return self._root
+
+    def resolve(self, path):
+        return os.path.join(self._root, path)
+
+    def new_path(self, board):
+        stamp = time.strftime('%Y%m%d-%H%M%S')
+        board = safe_name(board) or 'noname'
+        path = os.path.join(board, stamp)
+        suffix = 1
+        while os.path.exists(self.resolve(path)):
+            path = os.path.join(board, f'{stamp}-{suffix}')
+            suffix += 1
+        return path
+
+    def save(self, path, meta, columns):
+        directory = self.resolve(path)
+        new = not os.path.exists(directory)
+        os.makedirs(directory, exist_ok=True)
+
+        for name, values in columns.items():
+            np.save(os.path.join(directory, f'{name}.npy'), np.asarray(values))
+
+        meta = dict(meta, path=path, columns=sorted(columns))
+        with open(os.path.join(directory, 'meta.json'), mode='wt', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False, indent=2)
+
+        with index_lock:
+            if new:
+                with open(self._index_path, mode='at', encoding='utf-8') as f:
+                    f.write(json.dumps(meta, ensure_ascii=False) + '\n')
+            else:
+                self._update_index(meta)
+        return path
+
+    @property
+    def _index_path(self):
+        return os.path.join(self._root, 'index.jsonl')
+
+    def _update_index(self, meta):
+        # a later save of a sweep (the harmonic pass adds its columns) replaces its index line
+        entries = self.list()
+        updated = [meta if e.get('path') == meta['path'] else e for e in entries]
+        if not any(e.get('path') == meta['path'] for e in entries):
+            updated.append(meta)
+        elif updated == entries:
+            return
+        fd, temp = tempfile.mkstemp(prefix='index.', suffix='.tmp', dir=self._root)
+        try:
+            with open(fd, mode='wt', encoding='utf-8') as f:
+                f.writelines(json.dumps(e, ensure_ascii=False) + '\n' for e in updated)
+            os.replace(temp, self._index_path)
+        except OSError:
+            os.remove(temp)
+            raise
+
+    def load(self, path):
+        directory = self.resolve(path)
+        with open(os.path.join(directory, 'meta.json'), mode='rt', encoding='utf-8') as f:
+            return StoredSweep(directory, json.load(f))
+
+    def list(self, board=None):
+        try:
+            with open(self._index_path, mode='rt', encoding='utf-8') as f:
+                lines = [line for line in f if line.strip()]
+        except OSError:
+            return list()
+
+        entries = list()
+        for number, line in enumerate(lines, start=1):
+            try:
+                entries.append(json.loads(line))
+            except ValueError as ex:
+                logger.warning('skipping bad index line %d: %s', number, ex)
+        return [e for e in entries if board is None or e.get('board') == board]
@@ -0,0 +1,214 @@
+import numpy as np
+
+# storage modes: dtype and dB per LSB, quantized rows keep NaN as the lowest code;
+# float32 and db16 trade precision for memory in long multi-board sessions and archives
+storage_modes = {
+    'float64': (np.float64, None),
+    'float32': (np.float32, None),
+    'db16': (np.int16, 0.01),
+}
+nan_code = np.iinfo(np.int16).min
+
+
+def encode(values, mode):
+    dtype, scale = storage_modes[mode]
+    values = np.asarray(values, dtype=np.float64)
+    if scale is None:
+        return values.astype(dtype)
+    quantized = np.clip(np.round(values / scale), nan_code + 1, np.iinfo(dtype).max)
+    return np.where(np.isnan(values), nan_code, quantized).astype(dtype)
+
+
+def decode(raw, mode):
+    _, scale = storage_modes[mode]
+    if scale is None:
+        return raw
+    values = raw * scale
+    values[raw == nan_code] = np.nan
+    return values
+
+
+class TraceMatrix:
+    # preallocated (codes, points) trace storage, rows are keyed by LPF code,
+    # rows that were not measured hold NaN
+
+    __slots__ = ('_rows', '_mode', '_data', '_filled', '_count', '_scratch')
+
+    def __init__(self, rows, mode='float64'):
+        if mode not in storage_modes:
+            raise ValueError(f'unknown trace storage mode: {mode}')
+        self._rows = rows
+        self._mode = mode
+        self._data = None
+        self._filled = np.zeros(rows, dtype=bool)
+        self._count = 0
+        self._scratch = None
+
+    def __len__(self):
+        return self._count
+
+    def _allocate(self, points):
+        dtype, scale = storage_modes[self._mode]
+        self._data = np.full((self._rows, points), np.nan if scale is None else nan_code, dtype=dtype)
+
+    def _check(self, points):
+        if self._data is None:
+            self._allocate(points)
+        elif points != self._data.shape[1]:
+            raise ValueError(f'trace length {points} does not match sweep point count {self._data.shape[1]}')
+
+    def put(self, row, values):
+        self._check(len(values))
+
+        self._data[row] = encode(values, self._mode)
+        self._filled[row] = True
+        self._count = max(self._count, row + 1)
+        return self.row(row)
+
+    def reserve(self, row, points):
+        # row to be filled in place by a streamed trace, it counts as measured after commit();
+        # quantized storage is filled through a float scratch row
+        self._check(points)
+
+        self._filled[row] = False
+        if storage_modes[self._mode][1] is not None:
+            self._scratch = np.full(points, np.nan)
+            return self._scratch
+        self._data[row] = np.nan
+        return self._data[row]
+
+    def commit(self, row):
+        if storage_modes[self._mode][1] is not None:
+            self._data[row] = encode(self._scratch, self._mode)
+            self._scratch = None
+        self._filled[row] = True
+        self._count = max(self._count, row + 1)
+        return self.row(row)
+
+    def row(self, index):
+        return decode(self._data[index], self._mode)
+
+    def take(self, rows):
+        # decodes only the requested rows
+        if self._data is None:
+            return np.empty((0, 0), dtype=np.float64)
+        return decode(self._data[rows], self._mode)
+
+    def clear(self):
+        self._data = None
+        self._filled[:] = False
+        self._count = 0
+        self._scratch = None
+
+    @property
+    def data(self):
+        if self._data is None:
+            return np.empty((0, 0), dtype=np.float64)
+        return decode(self._data[:self._count], self._mode)
+
+    @property
+    def raw(self):
+        # stored representation, for archiving without a decode
+        if self._data is None:
+            return np.empty((0, 0), dtype=storage_modes[self._mode][0])
+        return self._data[:self._count]
+
+    @property
+    def filled(self):
+        return self._filled[:self._count]
+
+    @property
+    def points(self):
+        return 0 if self._data is None else self._data.shape[1]
+
+    @property
+    def mode(self):
+        return self._mode
+
+    @property
+    def nbytes(self):
+        return self._filled.nbytes + (0 if self._data is None else self._data.nbytes)
+
+
+class SharedAxis:
+    # frequency axes of a sweep keyed by code like TraceMatrix, but every distinct stimulus axis is parsed
+    # and stored once: rows only keep an index into the axes, recognised by a hash of the raw payload;
+    # parsed axes are kept across sweeps with the same analyzer setup
+
+    __slots__ = ('_rows', '_axes', '_keys', '_index', '_count')
+
+    max_axes = 8
+
+    def __init__(self, rows):
+        self._rows = rows
+        self._axes = list()
+        self._keys = dict()
+        self._index = np.full(rows, -1, dtype=np.intp)
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def _lookup(self, raw, parse):
+        key = len(raw), hash(raw)
+        index = self._keys.get(key)
+        if index is None:
+            index = self._keys[key] = len(self._axes)
+            self._axes.append(parse(raw))
+        return index
+
+    def parsed(self, raw, parse):
+        return self._axes[self._lookup(raw, parse)]
+
+    def put(self, row, raw, parse):
+        index = self._lookup(raw, parse)
+        self._index[row] = index
+        self._count = max(self._count, row + 1)
+        return self._axes[index]
+
+    def row(self, index):
+        return self._axes[self._index[index]]
+
+    def clear(self):
+        self._index[:] = -1
+        self._count = 0
+        if len(self._axes) > self.max_axes:
+            self._axes.clear()
+            self._keys.clear()
+
+    def axis(self, rows=None):
+        # one 1-D axis when the rows share it, otherwise a (rows, points) array
+        index = self._index[:self._count] if rows is None else self._index[rows]
+        used = np.unique(index[index >= 0])
+        if len(used) == 1:
+            return self._axes[used[0]]
+        return self._stack(index)
+
+    def _stack(self, index):
+        used = index[index >= 0]
+        points = len(self._axes[used[0]]) if len(used) else 0
+        data = np.full((len(index), points), np.nan)
+        for i, axis in enumerate(index):
+            if axis >= 0:
+                data[i] = self._axes[axis]
+        return data
+
+    @property
+    def data(self):
+        # (codes, points) like TraceMatrix.data, a read-only broadcast view for a single shared axis
+        index = self._index[:self._count]
+        used = np.unique(index[index >= 0])
+        if not len(used):
+            return np.empty((0, 0), dtype=np.float64)
+        if len(used) == 1:
+            axis = self._axes[used[0]]
+            return np.broadcast_to(axis, (self._count, len(axis)))
+        return self._stack(index)
+
+    @property
+    def axes(self):
+        return len(self._axes)
+
+    @property
+    def nbytes(self):
+        return self._index.nbytes + sum(axis.nbytes for axis in self._axes)
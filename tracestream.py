@@ -0,0 +1,142 @@
+import numpy as np
+
+from ieeeblock import block_dtype
+
+# bytes per read from the analyzer, also the largest piece of trace text held at once
+chunk_size = 64 * 1024
+
+
+def text_chunks(text, size=chunk_size):
+    # mock analyzers hand out their trace string piece by piece
+    for start in range(0, len(text), size):
+        yield text[start:start + size]
+
+
+def bytes_chunks(raw, size=chunk_size):
+    view = memoryview(raw)
+    for start in range(0, len(view), size):
+        yield view[start:start + size]
+
+
+def read_ascii_chunks(inst, size=chunk_size):
+    # pyvisa read_bytes stops at the termination character, a short or terminated chunk ends the response
+    term = inst.read_termination.encode() if inst.read_termination else b'\n'
+    while True:
+        chunk = inst.read_bytes(size, break_on_termchar=True)
+        yield chunk.decode('ascii')
+        if len(chunk) < size or chunk.endswith(term):
+            return
+
+
+def read_block_chunks(inst, size=chunk_size):
+    # definite length block: the header tells how much payload to read, the payload may hold termination bytes
+    head = inst.read_bytes(2)
+    digits = int(head[1:2])
+    if digits == 0:
+        # indefinite length block, only the terminator marks its end, as in query_block
+        yield head
+        yield inst.read_raw()
+        return
+
+    length = inst.read_bytes(digits)
+    yield head + length
+
+    remaining = int(length)
+    while remaining:
+        chunk = inst.read_bytes(min(size, remaining))
+        remaining -= len(chunk)
+        yield chunk
+    # trailing newline after the block
+    inst.read_bytes(1)
+
+
+def _take(values, start, stride, out, filled):
+    # keeps the values whose position in the whole response is a multiple of stride
+    values = values[(-start) % stride::stride]
+    end = filled + len(values)
+    if end > len(out):
+        raise ValueError(f'trace is longer than the {len(out)} reserved points')
+    out[filled:end] = values
+    return end
+
+
+class TraceStream:
+    # analyzer response that is parsed while it is read: parse_into() fills a preallocated row chunk by chunk
+    # and yields the number of points written so far, only one chunk of the response is kept in memory;
+    # stride=2 keeps the real parts of interleaved re,im pairs
+
+    def __init__(self, chunks, binary=False, stride=2):
+        self._chunks = chunks
+        self._binary = binary
+        self._stride = stride
+
+    def parse_into(self, out):
+        parse = self._parse_block if self._binary else self._parse_text
+        filled = 0
+        for filled in parse(out):
+            yield filled
+        if filled != len(out):
+            raise ValueError(f'trace has {filled} points, {len(out)} expected')
+
+    def read(self, points):
+        out = np.empty(points)
+        for _ in self.parse_into(out):
+            pass
+        return out
+
+    def _parse_text(self, out):
+        carry = ''
+        count = 0
+        filled = 0
+        for chunk in self._chunks:
+            if isinstance(chunk, bytes):
+                chunk = chunk.decode('ascii')
+            text = carry + chunk
+            cut = text.rfind(',')
+            if cut < 0:
+                carry = text
+                continue
+            # the last token may continue in the next chunk
+            text, carry = text[:cut], text[cut + 1:]
+            values = np.fromstring(text, dtype=np.float64, sep=',')
+            filled = _take(values, count, self._stride, out, filled)
+            count += len(values)
+            yield filled
+
+        if carry.strip():
+            values = np.fromstring(carry, dtype=np.float64, sep=',')
+            yield _take(values, count, self._stride, out, filled)
+
+    def _parse_block(self, out):
+        itemsize = block_dtype.itemsize
+        pending = b''
+        header = True
+        remaining = 0
+        count = 0
+        filled = 0
+        for chunk in self._chunks:
+            pending += bytes(chunk)
+            if header:
+                start = pending.find(b'#')
+                if start < 0 or len(pending) < start + 2:
+                    continue
+                digits = int(pending[start + 1:start + 2])
+                if len(pending) < start + 2 + digits:
+                    continue
+                # an indefinite length block (#0) runs to the end of the response
+                remaining = int(pending[start + 2:start + 2 + digits]) if digits else None
+                pending = pending[start + 2 + digits:]
+                header = False
+
+            usable = len(pending) if remaining is None else min(len(pending), remaining)
+            usable -= usable % itemsize
+            values = np.frombuffer(pending[:usable], dtype=block_dtype)
+            pending = pending[usable:]
+            if remaining is not None:
+                remaining -= usable
+
+            filled = _take(values, count, self._stride, out, filled)
+            count += len(values)
+            yield filled
+            if remaining == 0:
+                return
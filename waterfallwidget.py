@@ -0,0 +1,118 @@
+import time
+
+import numpy as np
+
+from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg, NavigationToolbar2QT
+from matplotlib.figure import Figure
+from PyQt5.QtCore import QTimer, pyqtSignal
+from PyQt5.QtWidgets import QVBoxLayout, QWidget
+
+from liveplotwidget import decimate
+
+
+def _edges(centers):
+    # cell edges around log-spaced centers
+    logs = np.log10(centers)
+    mid = (logs[:-1] + logs[1:]) / 2
+    return 10 ** np.concatenate([[2 * logs[0] - mid[0]], mid, [2 * logs[-1] - mid[-1]]])
+
+
+class WaterfallWidget(QWidget):
+    # code x frequency map of the whole sweep in a single QuadMesh, rows fill in as codes arrive,
+    # the cutoff frequency of every code is drawn over it
+
+    flushed = pyqtSignal(float)
+
+    def __init__(self, parent=None, domain=None, fps=5):
+        super().__init__(parent)
+
+        self._domain = domain
+
+        self._figure = Figure()
+        self._canvas = FigureCanvasQTAgg(self._figure)
+        self._axes = self._figure.add_subplot(111)
+
+        self._layout = QVBoxLayout()
+        self._layout.addWidget(NavigationToolbar2QT(self._canvas, self))
+        self._layout.addWidget(self._canvas)
+        self.setLayout(self._layout)
+
+        self._mesh = None
+        self._colorbar = None
+        self._contour = None
+        self._columns = None
+
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.setInterval(1000 // fps)
+        self._timer.timeout.connect(self._flush)
+
+        self._init()
+
+    def _init(self):
+        self._figure.subplots_adjust(bottom=0.150)
+        self._axes.set_title('Коэффициент преобразования по кодам')
+        self._axes.set_xscale('log')
+        self._axes.set_xlabel('F, Гц', labelpad=-2)
+        self._axes.set_ylabel('Код', labelpad=-2)
+        self._axes.set_ylim(-0.5, self._domain.MAXREG + 0.5)
+        self._contour, = self._axes.plot([], [], color='w', linewidth=1, linestyle='--')
+
+    def clear(self):
+        self._timer.stop()
+        if self._colorbar is not None:
+            self._colorbar.remove()
+        self._axes.clear()
+        self._mesh = None
+        self._colorbar = None
+        self._columns = None
+        self._init()
+        self._canvas.draw_idle()
+
+    def plotCode(self):
+        if not self._timer.isActive():
+            self._timer.start()
+
+    def plotStats(self):
+        self.plotCode()
+
+    def _image(self, amps):
+        # full code range, codes that are not measured yet stay masked
+        rows = np.full((self._domain.MAXREG + 1, amps.shape[1]), np.nan)
+        rows[:len(amps)] = amps
+        xs, ys = decimate(self._domain.lastXs, rows, int(self._axes.bbox.width), log=True)
+        if ys is rows:
+            return xs, ys
+        # min/max pairs from the decimation, keep the column maximum for the image
+        return xs[0::2], ys[:, 1::2]
+
+    def _flush(self):
+        amps = self._domain.amps
+        if not len(amps) or not len(self._domain.lastXs):
+            return
+        start = time.perf_counter()
+
+        xs, image = self._image(amps)
+        image = np.ma.masked_invalid(image)
+        if self._mesh is None or self._columns != len(xs):
+            if self._mesh is not None:
+                self._mesh.remove()
+            codes = np.arange(self._domain.MAXREG + 2) - 0.5
+            self._mesh = self._axes.pcolormesh(_edges(xs), codes, image, shading='flat', cmap='viridis')
+            self._columns = len(xs)
+            if self._colorbar is None:
+                self._colorbar = self._figure.colorbar(self._mesh, ax=self._axes, label='дБ')
+            else:
+                self._colorbar.update_normal(self._mesh)
+            self._axes.set_xlim(xs[0], xs[-1])
+        else:
+            self._mesh.set_array(image)
+        self._mesh.set_clim(image.min(), image.max())
+
+        cutoffs = self._domain.cutoffByCode[:len(amps)]
+        codes = np.arange(len(cutoffs))
+        self._contour.set_data(cutoffs, codes)
+        self._contour.set_zorder(self._mesh.get_zorder() + 1)
+
+        self._canvas.draw()
+        self.flushed.emit(time.perf_counter() - start)